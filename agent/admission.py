@@ -0,0 +1,178 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Tuple
+
+from metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Global limit on agent turns running at the same time, and on turns waiting for a slot
+MAX_INFLIGHT_TURNS = int(os.getenv("MAX_INFLIGHT_TURNS", "4"))
+MAX_QUEUED_TURNS = int(os.getenv("MAX_QUEUED_TURNS", "16"))
+# A queued turn is shed if it cannot start within this time
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "20"))
+# Consecutive model errors that open the circuit, and how long it stays open
+CIRCUIT_BREAKER_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "5"))
+CIRCUIT_BREAKER_COOLDOWN_SECONDS = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN_SECONDS", "30"))
+BUSY_MESSAGE = os.getenv("BUSY_MESSAGE", "I'm a bit overloaded right now, please try again in a minute.")
+
+# Turn priorities, lower runs first
+PRIORITY_COMMAND = 0
+PRIORITY_REMINDER = 1
+PRIORITY_MEDIA_CONTEXT = 2
+# Sender name of the scheduled reminders tools/crontab_tool.py posts to the webhook
+REMINDER_SENDER = "My past self"
+# Field only those reminder payloads carry (the WhatsApp notifier never sets it); the sender
+# name is a display name any contact could use
+REMINDER_FIELD = "scheduledReminder"
+
+
+def is_reminder(message: Dict[str, Any]) -> bool:
+    """
+    Tell whether a webhook delivery is a scheduled reminder rather than a message the user typed.
+
+    Args:
+        message (Dict[str, Any]): The incoming message data
+
+    Returns:
+        bool: True for reminders posted by cron
+    """
+    return message.get(REMINDER_FIELD) is True
+
+
+class Overloaded(Exception):
+    """Raised when a turn is rejected by admission control."""
+
+
+class ModelCallFailed(Exception):
+    """
+    Raised by the agent's model wrapper when a model call has failed for good (after its
+    retries). Only these count towards the circuit breaker: tool, MCP and other failures
+    of a turn say nothing about the model backend.
+    """
+
+
+class AdmissionController:
+    """
+    Bounds the number of agent turns in flight and sheds load when the model backend is saturated.
+
+    Turns beyond MAX_INFLIGHT_TURNS wait in a priority queue (commands, then scheduled
+    reminders, then media context). When the queue is full, a new turn displaces the
+    lowest-priority waiter or is rejected. A circuit breaker rejects turns right away after
+    repeated model errors, letting a single trial turn through once the cooldown has passed.
+    """
+
+    def __init__(
+        self,
+        max_inflight: int = MAX_INFLIGHT_TURNS,
+        max_queued: int = MAX_QUEUED_TURNS,
+        queue_timeout_seconds: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        breaker_threshold: int = CIRCUIT_BREAKER_THRESHOLD,
+        breaker_cooldown_seconds: float = CIRCUIT_BREAKER_COOLDOWN_SECONDS,
+    ):
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown_seconds = breaker_cooldown_seconds
+        self.inflight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._consecutive_errors = 0
+        self._open_until = 0.0
+        self._trial_running = False
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def _check_breaker(self) -> bool:
+        """Raise if the circuit is open. Returns True if this turn is the half-open trial."""
+        if self._consecutive_errors < self.breaker_threshold:
+            return False
+        if time.monotonic() < self._open_until or self._trial_running:
+            raise Overloaded("model backend is failing, circuit open")
+        self._trial_running = True
+        return True
+
+    def record_model_success(self) -> None:
+        if self._consecutive_errors >= self.breaker_threshold:
+            logger.info("Model call succeeded, circuit closed")
+        self._consecutive_errors = 0
+        self._trial_running = False
+
+    def record_model_error(self) -> None:
+        self._consecutive_errors += 1
+        self._trial_running = False
+        if self._consecutive_errors >= self.breaker_threshold:
+            self._open_until = time.monotonic() + self.breaker_cooldown_seconds
+            logger.warning("%d consecutive model errors, circuit open for %.0fs",
+                           self._consecutive_errors, self.breaker_cooldown_seconds)
+
+    def _enqueue(self, priority: int) -> asyncio.Future:
+        if self.queued >= self.max_queued:
+            pending = [w for w in self._waiters if not w[2].done()]
+            worst = max(pending, key=lambda w: (w[0], w[1]))
+            if worst[0] <= priority:
+                raise Overloaded("too many turns waiting")
+            worst[2].set_exception(Overloaded("displaced by a higher priority turn"))
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        return future
+
+    def _release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Hand the slot over directly so the in-flight count never dips below the limit
+                future.set_result(None)
+                return
+        self.inflight -= 1
+
+    @asynccontextmanager
+    async def admit(self, priority: int = PRIORITY_COMMAND, uses_model: bool = True):
+        """
+        Hold a turn slot for the duration of the block.
+
+        Args:
+            priority (int): One of the PRIORITY_* constants
+            uses_model (bool): Whether the turn calls the model; turns that do not (storing
+                media context) are not held back by an open circuit
+
+        Raises:
+            Overloaded: If the circuit is open, the queue is full or no slot frees up in time
+        """
+        is_trial = self._check_breaker() if uses_model else False
+        queued_at = time.perf_counter()
+        try:
+            if self.inflight < self.max_inflight and not self.queued:
+                self.inflight += 1
+            else:
+                future = self._enqueue(priority)
+                try:
+                    await asyncio.wait_for(future, self.queue_timeout_seconds)
+                except asyncio.TimeoutError:
+                    raise Overloaded(f"no turn slot within {self.queue_timeout_seconds}s")
+                except asyncio.CancelledError:
+                    # The slot may have been handed over right before the cancellation
+                    if future.done() and not future.cancelled() and future.exception() is None:
+                        self._release()
+                    raise
+        except Overloaded:
+            if is_trial:
+                self._trial_running = False
+            raise
+        finally:
+            observe_stage("queue_wait", time.perf_counter() - queued_at)
+
+        try:
+            yield
+        finally:
+            if is_trial:
+                self._trial_running = False
+            self._release()
@@ -1,12 +1,15 @@
 import asyncio
+from contextlib import aclosing
 from google.adk import Agent
 from dotenv import load_dotenv
 from google.adk.sessions import InMemorySessionService
 from google.adk.runners import Runner
+from google.adk.models.registry import LLMRegistry
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.genai import types
 from google.adk.events import Event, EventActions
-from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset, SseConnectionParams
-from typing import Optional
+from google.adk.tools.mcp_tool.mcp_toolset import SseConnectionParams
+from typing import List, Optional, Union
 import time
 import os
 import logging
@@ -15,6 +18,17 @@ from tools.time_tool import get_current_time
 from tools.file_tool import check_file_exists, get_file_info
 from tools.image_analysis_tool import analyze_image, extract_text_from_image, identify_objects_in_image
 from tools.audio_analysis_tool import transcribe_audio, analyze_audio_content, extract_speech_from_audio
+from tools.digest_tool import digest_chats
+from prompt_cache import PromptCache
+from mcp_pool import PooledMCPToolset
+from hedging import HedgedLlm
+from digest import digest_engine
+from media_store import MEDIA_CONTEXT_SECONDS, media_store
+import metrics
+import deadline
+from log_config import preview, sample
+
+logger = logging.getLogger(__name__)
 
 session_service = InMemorySessionService()
 
@@ -22,32 +36,60 @@ APP_NAME = "WhatsAppWatchdog"
 
 load_dotenv()
 
+PROMPT_PATH = os.path.join(os.path.dirname(__file__), "prompts", "prompt.md")
+_prompt_mtime = None
+
 def load_agent_prompt():
     """Load the agent prompt from the prompts directory."""
-    prompt_path = os.path.join(os.path.dirname(__file__), "prompts", "prompt.md")
+    global _prompt_mtime
     try:
-        with open(prompt_path, "r") as f:
+        _prompt_mtime = os.path.getmtime(PROMPT_PATH)
+        with open(PROMPT_PATH, "r") as f:
             return f.read().strip()
     except FileNotFoundError:
-        logging.error(f"Prompt file not found at {prompt_path}")
+        logging.error("Prompt file not found at %s", PROMPT_PATH)
         raise
 
+def reload_agent_prompt_if_changed(agent) -> bool:
+    """
+    Reload the agent instruction when the prompt file has been modified.
+    A new instruction changes the cached prefix fingerprint, so the prompt cache refreshes too.
+
+    Returns:
+        bool: True if the instruction was reloaded
+    """
+    try:
+        mtime = os.path.getmtime(PROMPT_PATH)
+    except OSError:
+        return False
+    if mtime == _prompt_mtime:
+        return False
+    agent.instruction = load_agent_prompt()
+    logging.info("Prompt file changed, agent instruction reloaded.")
+    return True
+
 # Set up the model
 AGENT_MODEL = os.getenv("AGENT_MODEL", "gemini-2.0-flash")
 QUERY_PREFIX = os.getenv("QUERY_PREFIX", "🤖 *butler:*")
 
+prompt_cache = PromptCache()
 
-async def initialize_agent_and_runner():
+async def initialize_agent_and_runner(model=None):
     """
     Initializes the agent (with MCP tools) and the runner.
+    model overrides AGENT_MODEL, e.g. with a stub BaseLlm for benchmarks.
     Returns: (runner, agent, exit_stack)
     """
     mcp_url = os.getenv("WHATSAPP_MCP_URL", "http://whatsapp-mcp:3001/mcp")
 
+    mcp_toolset = PooledMCPToolset(
+        connection_params=SseConnectionParams(url=mcp_url)
+    )
+    # Connect and list the MCP tools now rather than on the first turn
+    mcp_toolset.connect()
+
     tools = [
-        MCPToolset(
-            connection_params=SseConnectionParams(url=mcp_url)
-        ),
+        mcp_toolset,
         schedule_task,
         remove_task,
         list_tasks,
@@ -59,16 +101,29 @@ async def initialize_agent_and_runner():
         identify_objects_in_image,
         transcribe_audio,
         analyze_audio_content,
-        extract_speech_from_audio
+        extract_speech_from_audio,
+        digest_chats
     ]   
 
+    agent_model = model or AGENT_MODEL
+    if isinstance(agent_model, str):
+        agent_model = LLMRegistry.new_llm(agent_model)
+    # Digests read chats over the same MCP sessions; a model passed in (e.g. a benchmark stub)
+    # replaces DIGEST_MODEL too
+    digest_engine.attach(mcp_toolset.pool, agent_model if model is not None else None)
+
     agent = Agent(
-        model=AGENT_MODEL,
+        # Retries transient model errors and, with MODEL_HEDGING_ENABLED, hedges slow calls
+        model=HedgedLlm(agent_model),
         name=APP_NAME,
         description="WhatsApp Butler, an intelligent assistant specializing in helping users find and understand information from their WhatsApp conversations.",
         instruction=load_agent_prompt(),
         tools=tools,
         output_key="final_response_text",
+        before_model_callback=[metrics.before_model_callback, deadline.before_model_callback, prompt_cache.before_model_callback],
+        after_model_callback=[prompt_cache.after_model_callback, metrics.after_model_callback],
+        before_tool_callback=metrics.before_tool_callback,
+        after_tool_callback=metrics.after_tool_callback,
     )
     runner = Runner(
         agent=agent,
@@ -79,17 +134,45 @@ async def initialize_agent_and_runner():
     return runner, agent
 
 
-async def call_agent_async(query: str, runner, user_id, session_id, media_info: Optional[dict] = None) -> str:
-    """Sends a query to the agent and prints the final response."""
-    print(f"\n>>> User Query: {query}")
+def mcp_toolsets(agent) -> List[PooledMCPToolset]:
+    """The MCP toolsets of an agent, whose sessions must be closed on shutdown."""
+    return [tool for tool in agent.tools if isinstance(tool, PooledMCPToolset)]
+
+
+def format_reply(text: str) -> str:
+    """Prefix a reply with QUERY_PREFIX so the butler recognizes (and ignores) its own messages."""
+    return f"{QUERY_PREFIX}{'' if QUERY_PREFIX.endswith(' ') else ' '}{text}"
+
+
+def as_media_list(media_info: Optional[Union[dict, List[dict]]]) -> List[dict]:
+    """Normalize a single media info dict, a list of them, or None to a list."""
+    if not media_info:
+        return []
+    return list(media_info) if isinstance(media_info, list) else [media_info]
+
+
+async def call_agent_async(query: str, runner, user_id, session_id, media_info: Optional[Union[dict, List[dict]]] = None, streamer=None) -> str:
+    """Sends a query to the agent and prints the final response.
+    media_info may be a list when several media messages were coalesced into one turn.
+    With a streamer (see streaming.ResponseStreamer) the answer is sent in chunks while it is
+    generated, and only the part that was not streamed yet is returned."""
+    logger.info(">>> User Query: %s", preview(query))
     if media_info:
-        print(f">>> Media Info: {media_info}")
+        logger.debug(">>> Media Info: %s", preview(media_info))
+
+    reload_agent_prompt_if_changed(runner.agent)
 
     # Ensure session exists
-    session = await session_service.get_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
-    if session is None:
-        session = await session_service.create_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
-        logging.info(f"  [Session] Created new session for user {user_id} with session ID {session_id}.")
+    with metrics.stage("session"):
+        session = await session_service.get_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
+        if session is None:
+            session = await session_service.create_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
+            logging.info("  [Session] Created new session for user %s with session ID %s.", user_id, session_id)
+
+    # Deduplicate and index newly downloaded media, and keep it from eviction while it is in context
+    for media in as_media_list(media_info):
+        if media.get('filePath'):
+            await asyncio.to_thread(media_store.ingest, media['filePath'])
 
     # If this is just for context storage, store media info and return
     if query.startswith("[MEDIA_CONTEXT_ONLY]") and media_info:
@@ -109,7 +192,8 @@ async def call_agent_async(query: str, runner, user_id, session_id, media_info:
             timestamp=time.time()
         )
         await session_service.append_event(session, system_event)
-        logging.info(f">>> Media context stored: {media_info.get('filename', 'unknown')}")
+        filenames = ", ".join(m.get('filename', 'unknown') for m in as_media_list(media_info))
+        logging.info(">>> Media context stored: %s", preview(filenames))
         return ""
 
     # Prepare state changes including media context
@@ -134,7 +218,7 @@ async def call_agent_async(query: str, runner, user_id, session_id, media_info:
 
     # Enhance query with media information if available
     enhanced_query = query
-    current_media = media_info
+    current_media = as_media_list(media_info)
 
     # If no current media but there's a recent media in session, use it
     if not current_media:
@@ -149,23 +233,23 @@ async def call_agent_async(query: str, runner, user_id, session_id, media_info:
                     last_timestamp = state_delta.get("last_media_timestamp", 0)
                     current_time = time.time()
 
-                    # Use last media if it was recent (within 5 minutes)
-                    if last_media and (current_time - last_timestamp) < 300:
-                        current_media = last_media
+                    # Use last media if it was recent (within MEDIA_CONTEXT_SECONDS)
+                    if last_media and (current_time - last_timestamp) < MEDIA_CONTEXT_SECONDS:
+                        current_media = as_media_list(last_media)
                         enhanced_query += f"\n\n[CONTEXT: Referencing recent media from previous message]"
                         break
 
-    if current_media:
-        file_path = current_media.get('filePath', '')
-        file_exists = os.path.exists(file_path) if file_path else False
-        mimetype = current_media.get('mimetype', 'unknown')
-        filename = current_media.get('filename', 'unknown')
+    for media in current_media:
+        file_path = media.get('filePath', '')
+        file_exists = media_store.describe(file_path)["exists"] if file_path else False
+        mimetype = media.get('mimetype', 'unknown')
+        filename = media.get('filename', 'unknown')
 
         enhanced_query += f"\n\nMedia Context:"
         enhanced_query += f"\n- File: {filename}"
         enhanced_query += f"\n- Type: {mimetype}"
         enhanced_query += f"\n- Path: {file_path}"
-        enhanced_query += f"\n- Size: {current_media.get('filesize', 0)} bytes"
+        enhanced_query += f"\n- Size: {media.get('filesize', 0)} bytes"
         enhanced_query += f"\n- Available: {file_exists}"
 
         if file_exists:
@@ -176,23 +260,42 @@ async def call_agent_async(query: str, runner, user_id, session_id, media_info:
         else:
             enhanced_query += f"\n\nWarning: Media file not accessible at specified path."
 
+    # In the message rather than the instruction, so the instruction (and its prompt cache)
+    # is the same for every chat
+    enhanced_query += f"\n\n[User chat ID: {user_id}]"
+
     content = types.Content(role='user', parts=[types.Part(text=enhanced_query)])
-    async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=content):
-        # You can uncomment the line below to see *all* events during execution
-        print(f"  [Event] Author: {event.author}, Type: {type(event).__name__}, Final: {event.is_final_response()}, Content: {event.content}")
-        if event.partial and event.content and event.content.parts and event.content.parts[0].text:
-            partial_response_text += event.content.parts[0].text
-            logging.info(f"  [Partial] {partial_response_text}")
-
-        # Key Concept: is_final_response() marks the concluding message for the turn.
-        if event.is_final_response():
-            if event.content and event.content.parts:
-                # Assuming text response in the first part
-                final_response_text = event.content.parts[0].text
-            elif event.actions and event.actions.escalate: # Handle potential errors/escalations
-                final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
-            # Add more checks here if needed (e.g., specific error codes)
-            break # Stop processing events once the final response is found
-    final_response_text = f"{QUERY_PREFIX}{'' if QUERY_PREFIX.endswith(' ') else ' '}{final_response_text}"
-    logging.info(f"Final response text: {final_response_text}")
+    run_config = RunConfig(streaming_mode=StreamingMode.SSE) if streamer else RunConfig()
+    events = runner.run_async(user_id=user_id, session_id=session_id, new_message=content, run_config=run_config)
+    # Close the run in this task, also when the loop breaks early or the turn's deadline cancels it
+    async with aclosing(events):
+        async for event in events:
+            # Per-event lines are debug-only and sampled (LOG_EVENT_SAMPLE_RATE)
+            if logger.isEnabledFor(logging.DEBUG) and sample():
+                logger.debug("  [Event] Author: %s, Type: %s, Partial: %s, Content: %s",
+                             event.author, type(event).__name__, event.partial, preview(event.content))
+            if event.partial and event.content and event.content.parts and event.content.parts[0].text:
+                partial_response_text += event.content.parts[0].text
+                logger.debug("  [Partial] +%d chars (%d total)", len(event.content.parts[0].text), len(partial_response_text))
+                if streamer:
+                    await streamer.feed(event.content.parts[0].text)
+            elif streamer and not event.is_final_response():
+                streamer.reset()
+
+            # Key Concept: is_final_response() marks the concluding message for the turn.
+            if event.is_final_response():
+                if event.content and event.content.parts:
+                    # Assuming text response in the first part
+                    final_response_text = event.content.parts[0].text
+                elif event.actions and event.actions.escalate: # Handle potential errors/escalations
+                    final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
+                # Add more checks here if needed (e.g., specific error codes)
+                break # Stop processing events once the final response is found
+    if streamer:
+        final_response_text = streamer.remainder(final_response_text or "")
+        if not final_response_text:
+            logger.info("Final response fully streamed.")
+            return ""
+    final_response_text = format_reply(final_response_text)
+    logger.info("Final response text: %s", preview(final_response_text))
     return final_response_text
@@ -0,0 +1,99 @@
+"""
+Digest benchmark: summarising every active group, one chat after another versus with the digest engine.
+
+"sequential" reads the groups the way the agent does without digest_chats: get_chats, then
+one get_group_messages per group, each followed by a model call. "cold" is a first digest
+(every group fetched and summarised, at most --fanout at a time), "warm" the same digest
+asked again a minute later, when each group has one new message, and "repeat" the same digest
+asked again right away, when nothing is new and only the reduce step calls the model.
+
+Run from the agent directory:
+    python -m bench.digest
+    python -m bench.digest --model-latency-ms 1500 --mcp-latency-ms 300 --fanout 4 --json digest.json
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict
+
+from bench.harness import _serve, free_port
+from bench.stubs import FakeLlm, build_fake_mcp
+
+
+async def sequential(pool, model: FakeLlm) -> None:
+    """Stand-in for the agent's own tool loop: one model call per tool call."""
+    from digest import _tool_json
+    from google.adk.models import LlmRequest
+
+    async def model_call() -> None:
+        async for _ in model.generate_content_async(LlmRequest(model=model.model, contents=[])):
+            pass
+
+    session = await pool.create_session()
+    await model_call()
+    chats = _tool_json(await session.call_tool("get_chats", {}))
+    for chat in chats:
+        await model_call()
+        await session.call_tool("get_group_messages", {"groupId": chat["id"], "limit": 100})
+    await model_call()
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from google.adk.tools.mcp_tool.mcp_toolset import SseConnectionParams
+
+    from digest import DigestEngine
+    from mcp_pool import MCPSessionPool
+
+    mcp_port = free_port()
+    server = await _serve(build_fake_mcp(args.mcp_latency_ms).sse_app(), mcp_port)
+    pool = MCPSessionPool(SseConnectionParams(url=f"http://127.0.0.1:{mcp_port}/sse"))
+    # The stub model never calls tools: there are none in digest requests
+    model = FakeLlm(latency_ms=args.model_latency_ms, tool_calls=0)
+    engine = DigestEngine(fanout=args.fanout)
+    engine.attach(pool, model)
+    report: Dict[str, Any] = {}
+    try:
+        started = time.perf_counter()
+        await sequential(pool, model)
+        report["sequential_seconds"] = round(time.perf_counter() - started, 2)
+
+        for run_name in ("cold", "warm", "repeat"):
+            if run_name == "warm":
+                # The stub chats get a new message every minute
+                await asyncio.sleep(60 - time.time() % 60 + 1)
+            calls = model.calls
+            started = time.perf_counter()
+            result = await engine.digest(since_hours=args.since_hours)
+            report[f"{run_name}_seconds"] = round(time.perf_counter() - started, 2)
+            report[f"{run_name}_model_calls"] = model.calls - calls
+            report[f"{run_name}_new_messages"] = result["new_messages_summarized"]
+    finally:
+        await pool.close()
+        server[0].should_exit = True
+        await server[1]
+    return report
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-latency-ms", type=float, default=800, help="Mean latency of a model call")
+    parser.add_argument("--mcp-latency-ms", type=float, default=200, help="Mean latency of an MCP tool call")
+    parser.add_argument("--fanout", type=int, default=8, help="Chats fetched and summarised at the same time")
+    parser.add_argument("--since-hours", type=float, default=24, help="Digest window")
+    parser.add_argument("--json", help="Write the report to this file as JSON")
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = parse_args()
+    report = await run(args)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,177 @@
+"""Runs webhook_server.app in-process against local stubs and drives webhook workloads through it."""
+import asyncio
+import math
+import os
+import resource
+import socket
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+
+from bench.stubs import FakeLlm, build_fake_mcp, build_fake_whatsapp_api
+
+# (kind, HTTP status, latency in seconds) of one webhook delivery
+Result = Tuple[str, int, float]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _serve(app, port: int) -> Tuple[uvicorn.Server, asyncio.Task]:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+class BenchEnvironment:
+    """
+    The webhook server wired to a fake model, a fake SSE MCP server and a fake WhatsApp API.
+
+    The server reads its configuration from the environment at import time, so it is only
+    imported once start() has pointed the environment at the stubs. With workers > 1 the
+    server runs as worker processes (see bench/worker_app.py) behind the chat-affinity router.
+    """
+
+    def __init__(self, model_latency_ms: float = 800, tool_calls: int = 1, mcp_latency_ms: float = 50, send_latency_ms: float = 30, workers: int = 1):
+        self.model = FakeLlm(latency_ms=model_latency_ms, tool_calls=tool_calls)
+        self.workers = workers
+        self.mcp_latency_ms = mcp_latency_ms
+        self.send_latency_ms = send_latency_ms
+        self.sent: List[Dict[str, Any]] = []
+        self.webhook_url = ""
+        self._servers: List[Tuple[uvicorn.Server, asyncio.Task]] = []
+
+    async def start(self) -> None:
+        api_port, mcp_port, webhook_port = free_port(), free_port(), free_port()
+        os.environ["WHATSAPP_API_URL"] = f"http://127.0.0.1:{api_port}/api"
+        os.environ["WHATSAPP_MCP_URL"] = f"http://127.0.0.1:{mcp_port}/sse"
+        os.environ.setdefault("WHATSAPP_API_KEY", "bench")
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+        self._servers.append(await _serve(build_fake_whatsapp_api(self.send_latency_ms, self.sent), api_port))
+        self._servers.append(await _serve(build_fake_mcp(self.mcp_latency_ms).sse_app(), mcp_port))
+
+        if self.workers > 1:
+            from worker_pool import WorkerPool, create_router_app
+            os.environ["BENCH_MODEL_LATENCY_MS"] = str(self.model.latency_ms)
+            os.environ["BENCH_TOOL_CALLS"] = str(self.model.tool_calls)
+            app = create_router_app(WorkerPool(self.workers, app_path="bench.worker_app:app"))
+        else:
+            import webhook_server
+            webhook_server.app.state.agent_model = self.model
+            app = webhook_server.app
+        self._servers.append(await _serve(app, webhook_port))
+        self.webhook_url = f"http://127.0.0.1:{webhook_port}/webhook"
+        # The server listens before the agent is initialized; don't measure that wait
+        async with httpx.AsyncClient() as client:
+            while (await client.get(f"http://127.0.0.1:{webhook_port}/health/ready")).status_code != 200:
+                await asyncio.sleep(0.1)
+
+    async def stop(self) -> None:
+        for server, task in reversed(self._servers):
+            server.should_exit = True
+            try:
+                await asyncio.wait_for(task, 10)
+            except (asyncio.TimeoutError, Exception):
+                task.cancel()
+        self._servers.clear()
+
+
+async def drive(webhook_url: str, workload: List[Tuple[float, str, Dict[str, Any]]], speed: float = 1.0) -> Tuple[List[Result], float]:
+    """
+    Send a workload open-loop, honouring its arrival offsets.
+
+    Args:
+        webhook_url (str): The /webhook URL of the server under test
+        workload: (offset_seconds, kind, payload) deliveries sorted by offset
+        speed (float): Time compression (2.0 = twice as fast); 0 sends everything at once
+
+    Returns:
+        Tuple[List[Result], float]: Per-delivery results and the wall time of the run
+    """
+    results: List[Result] = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        started = time.perf_counter()
+
+        async def deliver(offset: float, kind: str, payload: Dict[str, Any]) -> None:
+            if speed > 0:
+                await asyncio.sleep(max(started + offset / speed - time.perf_counter(), 0))
+            sent_at = time.perf_counter()
+            try:
+                response = await client.post(webhook_url, json=payload)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            results.append((kind, status, time.perf_counter() - sent_at))
+
+        await asyncio.gather(*(deliver(offset, kind, payload) for offset, kind, payload in workload))
+        return results, time.perf_counter() - started
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(results: List[Result], wall_seconds: float, env: Optional[BenchEnvironment] = None) -> Dict[str, Any]:
+    """
+    Aggregate latency percentiles per kind, throughput and memory of a run.
+
+    Returns:
+        Dict[str, Any]: The report, ready to be printed or dumped as JSON
+    """
+    groups: Dict[str, List[Result]] = {"all": results}
+    for result in results:
+        groups.setdefault(result[0], []).append(result)
+
+    report: Dict[str, Any] = {"wall_seconds": round(wall_seconds, 3), "kinds": {}}
+    for kind, group in groups.items():
+        latencies = [latency for _, _, latency in group]
+        statuses: Dict[str, int] = {}
+        for _, status, _ in group:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        report["kinds"][kind] = {
+            "count": len(group),
+            "statuses": statuses,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p90_ms": round(percentile(latencies, 90) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "max_ms": round(max(latencies, default=0) * 1000, 1),
+        }
+    ok = sum(1 for _, status, _ in results if status == 200)
+    report["throughput_rps"] = round(ok / wall_seconds, 2) if wall_seconds else 0.0
+    # ru_maxrss is in KiB on Linux; the harness and the server share the process
+    report["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    if tracemalloc.is_tracing():
+        report["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+    if env is not None:
+        if env.workers > 1:
+            # The stub model runs in the worker processes
+            report["workers"] = env.workers
+        else:
+            report["model_calls"] = env.model.calls
+        report["whatsapp_sends"] = len(env.sent)
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{'kind':<10} {'count':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}  statuses")
+    for kind, row in report["kinds"].items():
+        print(f"{kind:<10} {row['count']:>6} {row['p50_ms']:>9} {row['p90_ms']:>9} {row['p99_ms']:>9} {row['max_ms']:>9}  {row['statuses']}")
+    extras = {k: v for k, v in report.items() if k != "kinds"}
+    print(", ".join(f"{k}: {v}" for k, v in extras.items()))
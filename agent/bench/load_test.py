@@ -0,0 +1,58 @@
+"""
+Offline load test of the webhook server with a stub model, stub MCP server and stub WhatsApp API.
+
+Run from the agent directory:
+    python -m bench.load_test --requests 200 --rate 5 --model-latency-ms 800
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import tracemalloc
+
+from bench.harness import BenchEnvironment, drive, print_report, summarize
+from bench.workloads import DEFAULT_MIX, generate_workload, make_media_files, parse_mix
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="Logical user actions to send (a burst counts once)")
+    parser.add_argument("--rate", type=float, default=5.0, help="Mean arrivals per second")
+    parser.add_argument("--chats", type=int, default=20, help="Distinct chats the load is spread over")
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                        help="Workload mix, e.g. text=0.6,media=0.15,burst=0.15,reminder=0.1")
+    parser.add_argument("--model-latency-ms", type=float, default=800, help="Mean latency of a stub model call")
+    parser.add_argument("--tool-calls", type=int, default=1, help="Tool calls the stub model makes per turn")
+    parser.add_argument("--mcp-latency-ms", type=float, default=50, help="Mean latency of a stub MCP tool call")
+    parser.add_argument("--send-latency-ms", type=float, default=30, help="Mean latency of a stub WhatsApp send")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1, help="Run the server as N worker processes behind the chat-affinity router")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report the traced Python allocation peak")
+    parser.add_argument("--json", help="Write the report to this file as JSON")
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = parse_args()
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    env = BenchEnvironment(args.model_latency_ms, args.tool_calls, args.mcp_latency_ms, args.send_latency_ms, args.workers)
+    await env.start()
+    try:
+        with tempfile.TemporaryDirectory() as media_dir:
+            media = make_media_files(media_dir)
+            workload = generate_workload(args.requests, args.rate, args.chats, parse_mix(args.mix), media, seed=args.seed)
+            results, wall_seconds = await drive(env.webhook_url, workload)
+    finally:
+        await env.stop()
+
+    report = summarize(results, wall_seconds, env)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,153 @@
+"""
+Replay webhook traffic recorded with TRAFFIC_RECORD_PATH against the stubbed backends.
+
+Run from the agent directory:
+    python -m bench.replay traffic.jsonl --speed 1             # original pacing
+    python -m bench.replay traffic.jsonl --speed 10            # 10x faster
+    python -m bench.replay traffic.jsonl --speed 0             # as fast as possible
+    python -m bench.replay traffic.jsonl --json new.json --baseline old.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import tracemalloc
+from typing import Any, Dict, List, Tuple
+
+from admission import REMINDER_FIELD, REMINDER_SENDER
+from bench.harness import BenchEnvironment, drive, percentile, print_report, summarize
+from bench.workloads import Workload
+
+_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp", "audio/ogg": ".ogg", "audio/mpeg": ".mp3"}
+
+
+def load_recording(path: str, limit: int = 0) -> List[Dict[str, Any]]:
+    """Read a recording, sorted by arrival time."""
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    entries.sort(key=lambda e: e["t"])
+    return entries[:limit] if limit else entries
+
+
+def build_workload(entries: List[Dict[str, Any]], media_dir: str) -> Workload:
+    """
+    Turn recorded entries back into webhook deliveries.
+    Media is replaced by placeholder files of the recorded size, one per (mimetype, size).
+    """
+    workload: Workload = []
+    media_files: Dict[Tuple[str, int], str] = {}
+    if not entries:
+        return workload
+    first = entries[0]["t"]
+    for entry in entries:
+        payload: Dict[str, Any] = {
+            "from": f"rec-{entry['c']}",
+            "name": REMINDER_SENDER if entry.get("r") else "Replay user",
+            "message": entry.get("x", ""),
+            "timestamp": int(entry["t"]),
+        }
+        kind = "reminder" if entry.get("r") else "text"
+        if entry.get("r"):
+            payload[REMINDER_FIELD] = True
+        else:
+            payload.update({"isGroup": bool(entry.get("g")), "hasMedia": False})
+            if entry.get("m"):
+                payload["messageId"] = entry["m"]
+            if entry.get("g"):
+                kind = "group"
+        if entry.get("md"):
+            media_type, mimetype, size = entry["md"]
+            mimetype = mimetype or "application/octet-stream"
+            key = (mimetype, int(size or 0))
+            if key not in media_files:
+                path = os.path.join(media_dir, f"media-{len(media_files)}{_EXTENSIONS.get(mimetype, '.bin')}")
+                with open(path, "wb") as f:
+                    f.write(os.urandom(key[1]))
+                media_files[key] = path
+            path = media_files[key]
+            payload.update({
+                "hasMedia": True,
+                "mediaType": media_type,
+                "mediaInfo": {"filePath": path, "mimetype": mimetype, "filename": os.path.basename(path), "filesize": key[1]},
+            })
+            kind = "media"
+        workload.append((entry["t"] - first, kind, payload))
+    return workload
+
+
+def recorded_latency(entries: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Latency percentiles observed in production when the traffic was recorded."""
+    latencies = [entry["l"] / 1000 for entry in entries if "l" in entry]
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def print_comparison(report: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print latency and memory deltas of this run against a baseline report."""
+    print("\nComparison with baseline (new - old):")
+    for kind, row in report["kinds"].items():
+        old = baseline.get("kinds", {}).get(kind)
+        if not old:
+            continue
+        deltas = []
+        for metric in ("p50_ms", "p99_ms"):
+            change = row[metric] - old[metric]
+            relative = f" ({change / old[metric]:+.0%})" if old[metric] else ""
+            deltas.append(f"{metric} {change:+.1f}{relative}")
+        print(f"  {kind:<10} " + ", ".join(deltas))
+    for metric in ("throughput_rps", "max_rss_mb", "traced_peak_mb"):
+        if metric in report and metric in baseline:
+            print(f"  {metric}: {report[metric] - baseline[metric]:+.2f}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", help="File written by the server with TRAFFIC_RECORD_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed factor (1 = recorded pacing, 0 = max speed)")
+    parser.add_argument("--limit", type=int, default=0, help="Only replay the first N deliveries")
+    parser.add_argument("--model-latency-ms", type=float, default=800, help="Mean latency of a stub model call")
+    parser.add_argument("--tool-calls", type=int, default=1, help="Tool calls the stub model makes per turn")
+    parser.add_argument("--mcp-latency-ms", type=float, default=50, help="Mean latency of a stub MCP tool call")
+    parser.add_argument("--send-latency-ms", type=float, default=30, help="Mean latency of a stub WhatsApp send")
+    parser.add_argument("--workers", type=int, default=1, help="Run the server as N worker processes behind the chat-affinity router")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report the traced Python allocation peak")
+    parser.add_argument("--json", help="Write the report to this file as JSON")
+    parser.add_argument("--baseline", help="Report of a previous run (--json) to compare against")
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = parse_args()
+    entries = load_recording(args.recording, args.limit)
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    env = BenchEnvironment(args.model_latency_ms, args.tool_calls, args.mcp_latency_ms, args.send_latency_ms, args.workers)
+    await env.start()
+    try:
+        with tempfile.TemporaryDirectory() as media_dir:
+            workload = build_workload(entries, media_dir)
+            results, wall_seconds = await drive(env.webhook_url, workload, speed=args.speed)
+    finally:
+        await env.stop()
+
+    report = summarize(results, wall_seconds, env)
+    report["recorded"] = recorded_latency(entries)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            print_comparison(report, json.load(f))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
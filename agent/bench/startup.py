@@ -0,0 +1,92 @@
+"""
+Cold-start benchmark: time from process start until the webhook server is live and ready.
+
+Each run starts a fresh `uvicorn webhook_server:app` process and polls /health (live:
+the port answers) and /health/ready (ready: the agent can take turns). No model or MCP
+call is made during startup, so no backend is needed.
+
+Run from the agent directory:
+    python -m bench.startup --runs 5
+    python -m bench.startup --runs 5 --json startup.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from bench.harness import free_port, percentile
+
+
+async def measure_once(timeout: float) -> Dict[str, float]:
+    """Start one server process and return its seconds to live and to ready."""
+    port = free_port()
+    env = {**os.environ, "LOG_LEVEL": "WARNING", "WHATSAPP_MCP_URL": f"http://127.0.0.1:{free_port()}/sse"}
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-W", "ignore", "-m", "uvicorn", "webhook_server:app",
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+        env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    timings: Dict[str, float] = {}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=2) as client:
+            while "ready" not in timings:
+                if time.perf_counter() - started > timeout:
+                    raise TimeoutError(f"server not ready after {timeout}s")
+                if process.returncode is not None:
+                    raise RuntimeError(f"server exited with code {process.returncode}")
+                try:
+                    if "live" not in timings and (await client.get("/health")).status_code == 200:
+                        timings["live"] = time.perf_counter() - started
+                    if "live" in timings and (await client.get("/health/ready")).status_code == 200:
+                        timings["ready"] = time.perf_counter() - started
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.02)
+    finally:
+        process.terminate()
+        await process.wait()
+    return timings
+
+
+def summarize(runs: List[Dict[str, float]]) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"runs": len(runs)}
+    for key in ("live", "ready"):
+        values = [run[key] for run in runs]
+        report[key] = {
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "max_ms": round(max(values) * 1000, 1),
+        }
+    return report
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts to measure")
+    parser.add_argument("--timeout", type=float, default=120, help="Give up on a run after this many seconds")
+    parser.add_argument("--json", help="Write the report to this file as JSON")
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = parse_args()
+    runs = []
+    for i in range(args.runs):
+        timings = await measure_once(args.timeout)
+        print(f"run {i + 1}: live {timings['live'] * 1000:.0f} ms, ready {timings['ready'] * 1000:.0f} ms")
+        runs.append(timings)
+    report = summarize(runs)
+    print(f"live  p50 {report['live']['p50_ms']} ms, max {report['live']['max_ms']} ms")
+    print(f"ready p50 {report['ready']['p50_ms']} ms, max {report['ready']['max_ms']} ms")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+"""Local stand-ins for Gemini, the WhatsApp MCP server and the WhatsApp API used by the benchmarks.
+
+The fake MCP tools answer in the text format of the real server: "Retrieved N ...:" and JSON.
+"""
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timezone
+from typing import AsyncGenerator, List
+
+from fastapi import FastAPI, Request
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types
+from mcp.server.fastmcp import FastMCP
+
+# Tools the fake model calls, in order of preference, when they are available to the agent
+PREFERRED_TOOLS = ["get_chats", "get_current_time", "list_tasks"]
+
+FAKE_ANSWER = (
+    "Here is what I found in your chats. The family group talked about dinner plans. "
+    "Your sister shared beach photos and everyone agreed on a movie night on Saturday.\n\n"
+    "In the project group John reminded everyone that the deadline is Friday at 5pm. "
+    "Nothing else needs your attention today."
+)
+
+
+def _jitter(latency_ms: float, jitter: float) -> float:
+    """Latency in seconds with +/- jitter (fraction of the latency)."""
+    return max(latency_ms * (1 + random.uniform(-jitter, jitter)), 0) / 1000
+
+
+class FakeLlm(BaseLlm):
+    """
+    Stub model with configurable latency that calls tools before answering.
+
+    Each model call waits latency_ms (+/- jitter). The first tool_calls calls of a turn
+    request one of PREFERRED_TOOLS; the next one returns FAKE_ANSWER, streamed in chunks
+    when the runner asks for streaming.
+    """
+
+    model: str = "fake-llm"
+    latency_ms: float = 800
+    jitter: float = 0.3
+    tool_calls: int = 1
+    stream_chunk_chars: int = 40
+    calls: int = 0
+
+    @classmethod
+    def supported_models(cls) -> List[str]:
+        return [r"fake-llm"]
+
+    def _tool_responses_this_turn(self, llm_request: LlmRequest) -> int:
+        count = 0
+        for content in reversed(llm_request.contents):
+            parts = content.parts or []
+            if content.role == "user" and any(p.text for p in parts):
+                break
+            count += sum(1 for p in parts if p.function_response)
+        return count
+
+    def _pick_tool(self, llm_request: LlmRequest):
+        available = llm_request.tools_dict or {}
+        for name in PREFERRED_TOOLS:
+            if name in available:
+                return name
+        return None
+
+    def _usage(self, llm_request: LlmRequest, output_tokens: int) -> types.GenerateContentResponseUsageMetadata:
+        return types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=3000 + 50 * len(llm_request.contents),
+            candidates_token_count=output_tokens,
+        )
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        self.calls += 1
+        await asyncio.sleep(_jitter(self.latency_ms, self.jitter))
+
+        tool = self._pick_tool(llm_request)
+        if tool and self._tool_responses_this_turn(llm_request) < self.tool_calls:
+            yield LlmResponse(
+                content=types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(name=tool, args={}))]),
+                usage_metadata=self._usage(llm_request, 10),
+            )
+            return
+
+        if stream:
+            for i in range(0, len(FAKE_ANSWER), self.stream_chunk_chars):
+                await asyncio.sleep(0.02)
+                yield LlmResponse(
+                    content=types.Content(role="model", parts=[types.Part(text=FAKE_ANSWER[i:i + self.stream_chunk_chars])]),
+                    partial=True,
+                )
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=FAKE_ANSWER)]),
+            usage_metadata=self._usage(llm_request, len(FAKE_ANSWER) // 4),
+        )
+
+
+def _fake_messages(chat_id: str, limit: int) -> List[dict]:
+    """Ids and timestamps of a chat's last messages: one per minute, so a new one appears every minute."""
+    minute = int(time.time() // 60)
+    return [
+        {"id": f"{chat_id}-{m}", "timestamp": datetime.fromtimestamp(m * 60, timezone.utc).isoformat()}
+        for m in range(minute - limit + 1, minute + 1)
+    ]
+
+
+def build_fake_mcp(latency_ms: float, jitter: float = 0.3) -> FastMCP:
+    """
+    Fake WhatsApp MCP server exposing the read tools the agent uses most, over SSE at /sse.
+
+    Args:
+        latency_ms (float): Mean latency of every tool call
+        jitter (float): Latency jitter as a fraction of latency_ms
+    """
+    mcp = FastMCP("whatsapp")
+
+    @mcp.tool()
+    async def get_chats() -> str:
+        """Get a list of all WhatsApp chats."""
+        await asyncio.sleep(_jitter(latency_ms, jitter))
+        now = datetime.now(timezone.utc).isoformat()
+        chats = [{"id": f"group-{i}@g.us", "name": f"Group {i}", "unreadCount": i, "timestamp": now} for i in range(20)]
+        return f"Retrieved {len(chats)} chats:\n{json.dumps(chats, indent=2)}"
+
+    @mcp.tool()
+    async def get_messages(number: str, limit: int = 10) -> str:
+        """Get messages from a specific chat."""
+        await asyncio.sleep(_jitter(latency_ms, jitter))
+        messages = [{**message, "body": f"message {i} from {number}", "fromMe": False} for i, message in enumerate(_fake_messages(number, limit))]
+        return f"Retrieved {len(messages)} messages from {number}:\n{json.dumps(messages, indent=2)}"
+
+    @mcp.tool()
+    async def get_group_messages(groupId: str, limit: int = 10) -> str:
+        """Get messages from a group."""
+        await asyncio.sleep(_jitter(latency_ms, jitter))
+        messages = [{**message, "body": f"group message {i} in {groupId}", "contact": "someone", "fromMe": False}
+                    for i, message in enumerate(_fake_messages(groupId, limit))]
+        return f"Retrieved {len(messages)} messages from group {groupId}:\n{json.dumps(messages, indent=2)}"
+
+    @mcp.tool()
+    async def send_message(number: str, message: str) -> dict:
+        """Send a message to a WhatsApp contact."""
+        await asyncio.sleep(_jitter(latency_ms, jitter))
+        return {"messageId": f"sent-{random.randint(0, 1 << 30)}"}
+
+    return mcp
+
+
+def build_fake_whatsapp_api(latency_ms: float, sent: list, jitter: float = 0.3) -> FastAPI:
+    """
+    Fake WhatsApp API that records every /api/send call.
+
+    Args:
+        latency_ms (float): Mean latency of a send
+        sent (list): Receives one dict per sent message
+        jitter (float): Latency jitter as a fraction of latency_ms
+    """
+    api = FastAPI(title="Fake WhatsApp API")
+
+    @api.post("/api/send")
+    async def send(request: Request):
+        data = await request.json()
+        await asyncio.sleep(_jitter(latency_ms, jitter))
+        sent.append({"number": data.get("number"), "chars": len(data.get("message", ""))})
+        return {"messageId": f"sent-{len(sent)}"}
+
+    return api
@@ -0,0 +1,11 @@
+"""webhook_server.app wired to the stub model, for benchmark runs with several worker processes."""
+import os
+
+import webhook_server
+from bench.stubs import FakeLlm
+
+app = webhook_server.app
+app.state.agent_model = FakeLlm(
+    latency_ms=float(os.environ["BENCH_MODEL_LATENCY_MS"]),
+    tool_calls=int(os.environ["BENCH_TOOL_CALLS"]),
+)
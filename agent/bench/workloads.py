@@ -0,0 +1,124 @@
+"""Synthetic chat workloads: text commands, media, typing bursts and scheduled reminders."""
+import os
+import random
+from typing import Any, Dict, List, Tuple
+
+from admission import REMINDER_FIELD, REMINDER_SENDER
+
+# A workload is a list of (offset_seconds, kind, webhook payload), sorted by offset
+Workload = List[Tuple[float, str, Dict[str, Any]]]
+
+DEFAULT_MIX = {"text": 0.6, "media": 0.15, "burst": 0.15, "reminder": 0.1}
+
+# Message prefix of the reminders tools/crontab_tool.py schedules
+REMINDER_PREFIX = os.getenv("QUERY_PREFIX", "/query ")
+REMINDER_TEXT = "Send a message to the user with the content: 'Time to check the project status!'"
+
+COMMANDS = [
+    "Summarize today's messages in the family group",
+    "What was the address of that restaurant Mark recommended?",
+    "Find John's message about the project deadline",
+    "Did anyone reply to my question about the weekend?",
+]
+BURST_PARTS = [
+    ["hey", "can you check the project group", "and tell me what John said about Friday?"],
+    ["summarize", "the family group", "from today please."],
+]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse a mix like "text=0.6,media=0.2,burst=0.1,reminder=0.1"."""
+    mix = {}
+    for item in spec.split(","):
+        kind, _, weight = item.partition("=")
+        mix[kind.strip()] = float(weight)
+    unknown = set(mix) - set(DEFAULT_MIX)
+    if unknown:
+        raise ValueError(f"Unknown workload kinds: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def make_media_files(directory: str) -> Dict[str, Dict[str, Any]]:
+    """Write small placeholder media files and return their mediaInfo by type."""
+    os.makedirs(directory, exist_ok=True)
+    files = {"image": ("photo.jpg", "image/jpeg", 48_000), "audio": ("voice.ogg", "audio/ogg", 24_000)}
+    media = {}
+    for media_type, (filename, mimetype, size) in files.items():
+        path = os.path.join(directory, filename)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        media[media_type] = {"filePath": path, "mimetype": mimetype, "filename": filename, "filesize": size}
+    return media
+
+
+def generate_workload(
+    requests: int,
+    rate: float,
+    chats: int,
+    mix: Dict[str, float],
+    media: Dict[str, Dict[str, Any]],
+    burst_gap_seconds: float = 0.3,
+    seed: int = 42,
+) -> Workload:
+    """
+    Generate an open-loop workload with Poisson arrivals.
+
+    Args:
+        requests (int): Number of logical user actions (a burst counts once)
+        rate (float): Mean arrivals per second
+        chats (int): Number of distinct chats the actions are spread over
+        mix (Dict[str, float]): Relative weight of each kind of action
+        media (Dict[str, Dict[str, Any]]): mediaInfo by media type, from make_media_files
+        burst_gap_seconds (float): Spacing of the messages of a burst
+        seed (int): Random seed, so runs are comparable
+
+    Returns:
+        Workload: The webhook deliveries to send
+    """
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    workload: Workload = []
+    now = 0.0
+    message_id = 0
+
+    def payload(chat: str, text: str, **extra) -> Dict[str, Any]:
+        nonlocal message_id
+        message_id += 1
+        return {
+            "from": chat,
+            "name": "Bench user",
+            "message": text,
+            "isGroup": False,
+            "timestamp": int(1_700_000_000 + now),
+            "messageId": f"bench_{message_id}",
+            "hasMedia": False,
+            **extra,
+        }
+
+    for _ in range(requests):
+        now += rng.expovariate(rate)
+        chat = f"5500000{rng.randrange(chats):05d}"
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "text":
+            workload.append((now, kind, payload(chat, rng.choice(COMMANDS))))
+        elif kind == "media":
+            media_type = rng.choice(list(media))
+            workload.append((now, kind, payload(
+                chat, "", hasMedia=True, mediaType=media_type, mediaInfo=media[media_type]
+            )))
+        elif kind == "burst":
+            for i, part in enumerate(rng.choice(BURST_PARTS)):
+                workload.append((now + i * burst_gap_seconds, kind, payload(chat, part)))
+        elif kind == "reminder":
+            # The payload cron posts for a scheduled reminder: the same text at every firing,
+            # no WhatsApp message id, and the firing time as timestamp
+            workload.append((now, kind, {
+                "from": chat,
+                "name": REMINDER_SENDER,
+                "message": f"{REMINDER_PREFIX}{REMINDER_TEXT}",
+                REMINDER_FIELD: True,
+                "timestamp": int(1_700_000_000 + now),
+            }))
+
+    workload.sort(key=lambda item: item[0])
+    return workload
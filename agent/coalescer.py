@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from admission import is_reminder
+
+logger = logging.getLogger(__name__)
+
+# Quiet period after the last message of a chat before its burst is processed (0 disables coalescing)
+COALESCE_WINDOW_MS = int(os.getenv("COALESCE_WINDOW_MS", "1500"))
+# Upper bound on how long the first message of a burst may wait
+COALESCE_MAX_WAIT_MS = int(os.getenv("COALESCE_MAX_WAIT_MS", "5000"))
+
+# Trailing characters that mark a text message as a complete request
+REQUEST_TERMINATORS = ("?", "!", ".")
+
+
+def ends_request(message: Dict[str, Any]) -> bool:
+    """
+    Decide whether a message clearly completes the user's request, so the burst can be
+    processed without waiting for the rest of the coalescing window.
+
+    Args:
+        message (Dict[str, Any]): The incoming message data
+
+    Returns:
+        bool: True if no further messages should be waited for
+    """
+    # Scheduled reminders are never part of a typing burst
+    if is_reminder(message):
+        return True
+    # Media is usually followed by more media or by the command referring to it
+    if message.get("hasMedia"):
+        return False
+    text = (message.get("message") or "").strip()
+    return text.endswith(REQUEST_TERMINATORS)
+
+
+class _Burst:
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.messages: List[Dict[str, Any]] = []
+        self.started_at = time.monotonic()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class ChatCoalescer:
+    """
+    Merges bursts of messages from the same chat into a single turn.
+
+    Every message of a burst waits on the same future, which resolves with the result of
+    the handler once it has processed the whole burst.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str, List[Dict[str, Any]]], Awaitable[Any]],
+        window_ms: int = COALESCE_WINDOW_MS,
+        max_wait_ms: int = COALESCE_MAX_WAIT_MS,
+    ):
+        self.handler = handler
+        self.window_ms = window_ms
+        self.max_wait_ms = max_wait_ms
+        self._bursts: Dict[str, _Burst] = {}
+        self._tasks = set()
+
+    async def submit(self, chat_id: str, message: Dict[str, Any]) -> Any:
+        """
+        Add a message to the pending burst of its chat and wait until the burst is processed.
+
+        Args:
+            chat_id (str): The chat ID of the message
+            message (Dict[str, Any]): The incoming message data
+
+        Returns:
+            Any: The result of the handler for the whole burst
+        """
+        if self.window_ms <= 0:
+            return await self.handler(chat_id, [message])
+
+        loop = asyncio.get_running_loop()
+        burst = self._bursts.get(chat_id)
+        if burst is None:
+            burst = _Burst(loop.create_future())
+            self._bursts[chat_id] = burst
+        burst.messages.append(message)
+        if burst.timer:
+            burst.timer.cancel()
+
+        waited_ms = (time.monotonic() - burst.started_at) * 1000
+        if ends_request(message) or waited_ms >= self.max_wait_ms:
+            self._flush(chat_id)
+        else:
+            delay_ms = min(self.window_ms, self.max_wait_ms - waited_ms)
+            burst.timer = loop.call_later(delay_ms / 1000, self._flush, chat_id)
+        return await asyncio.shield(burst.future)
+
+    def _flush(self, chat_id: str) -> None:
+        burst = self._bursts.pop(chat_id, None)
+        if burst is None:
+            return
+        if burst.timer:
+            burst.timer.cancel()
+        if len(burst.messages) > 1:
+            logger.info("Coalesced %d messages from chat %s into one turn", len(burst.messages), chat_id)
+        task = asyncio.create_task(self._run(chat_id, burst))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, chat_id: str, burst: _Burst) -> None:
+        try:
+            burst.future.set_result(await self.handler(chat_id, burst.messages))
+        except asyncio.CancelledError:
+            # e.g. on shutdown: fail every delivery of the burst now instead of at its HTTP timeout
+            burst.future.set_exception(RuntimeError(f"Turn for chat {chat_id} was cancelled"))
+            raise
+        except Exception as e:
+            burst.future.set_exception(e)
@@ -0,0 +1,92 @@
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+# Time budget of a whole turn, from the moment its messages are handed to the agent
+TURN_TIMEOUT_SECONDS = float(os.getenv("TURN_TIMEOUT_SECONDS", "120"))
+# Per-stage defaults; a stage never gets more than what is left of the turn
+MODEL_CALL_TIMEOUT_SECONDS = float(os.getenv("MODEL_CALL_TIMEOUT_SECONDS", "60"))
+TOOL_CALL_TIMEOUT_SECONDS = float(os.getenv("TOOL_CALL_TIMEOUT_SECONDS", "30"))
+MEDIA_MODEL_TIMEOUT_SECONDS = float(os.getenv("MEDIA_MODEL_TIMEOUT_SECONDS", "45"))
+WHATSAPP_SEND_TIMEOUT_SECONDS = float(os.getenv("WHATSAPP_SEND_TIMEOUT_SECONDS", "10"))
+DEADLINE_MESSAGE = os.getenv(
+    "DEADLINE_MESSAGE",
+    "Sorry, this is taking longer than it should. Please try again in a moment, or ask something more specific.",
+)
+
+# time.monotonic() by which the current turn must be done, None outside a turn
+deadline_var: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a turn runs past its deadline, or a stage starts after it has passed."""
+
+
+@asynccontextmanager
+async def turn_deadline(seconds: float = TURN_TIMEOUT_SECONDS):
+    """
+    Give the enclosed turn a deadline, seen by every model and tool call it makes
+    (tasks started within inherit it with the context), and cancel the turn when it
+    passes.
+
+    Raises:
+        DeadlineExceeded: If the enclosed block is still running at the deadline
+    """
+    token = deadline_var.set(time.monotonic() + seconds)
+    scope = asyncio.timeout(seconds)
+    try:
+        async with scope:
+            yield
+    except TimeoutError as e:
+        # Other timeouts of the turn pass through unchanged
+        if scope.expired():
+            raise DeadlineExceeded(f"turn deadline of {seconds:g}s exceeded") from e
+        raise
+    finally:
+        deadline_var.reset(token)
+
+
+def time_left() -> Optional[float]:
+    """Seconds until the current turn's deadline, None outside a turn."""
+    deadline = deadline_var.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def stage_timeout(default: float) -> float:
+    """
+    Timeout of a stage: its default, capped by what is left of the turn.
+
+    Args:
+        default (float): The stage's own timeout in seconds
+
+    Returns:
+        float: Seconds the stage may take
+
+    Raises:
+        DeadlineExceeded: If the turn's deadline has already passed
+    """
+    left = time_left()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("turn deadline exceeded")
+    return min(default, left)
+
+
+def before_model_callback(callback_context, llm_request):
+    """
+    Bound the model call by MODEL_CALL_TIMEOUT_SECONDS and the turn's deadline,
+    as the HTTP timeout of the Gemini request.
+    """
+    # Loaded with the agent; kept off the webhook server's import path
+    from google.genai import types
+
+    timeout_ms = int(stage_timeout(MODEL_CALL_TIMEOUT_SECONDS) * 1000)
+    if llm_request.config is None:
+        llm_request.config = types.GenerateContentConfig()
+    http_options = llm_request.config.http_options or types.HttpOptions()
+    llm_request.config.http_options = http_options.model_copy(update={"timeout": timeout_ms})
+    return None
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# How long a delivery is remembered, and how many deliveries at most
+WEBHOOK_DEDUP_WINDOW_SECONDS = float(os.getenv("WEBHOOK_DEDUP_WINDOW_SECONDS", "600"))
+WEBHOOK_DEDUP_MAX_ENTRIES = int(os.getenv("WEBHOOK_DEDUP_MAX_ENTRIES", "10000"))
+
+IN_FLIGHT = {"status": "success", "duplicate": True, "in_flight": True}
+
+
+def delivery_key(message: Dict[str, Any]) -> str:
+    """
+    Build the idempotency key of a webhook delivery.
+
+    Uses the WhatsApp message id when the notifier provides one, otherwise a fingerprint
+    of the sender, content, timestamp and attached media (e.g. for scheduled reminders,
+    whose timestamp is their firing time, so every firing of a recurring reminder runs).
+
+    Args:
+        message (Dict[str, Any]): The incoming message data
+
+    Returns:
+        str: The idempotency key
+    """
+    message_id = message.get("messageId")
+    if message_id:
+        return f"id:{message_id}"
+    media_info = message.get("mediaInfo") or {}
+    fingerprint = json.dumps([
+        message.get("from", ""),
+        message.get("message", ""),
+        message.get("timestamp"),
+        media_info.get("filePath"),
+    ], ensure_ascii=False)
+    return "fp:" + hashlib.sha256(fingerprint.encode()).hexdigest()
+
+
+class WebhookDeduplicator:
+    """
+    Bounded, time-windowed set of seen webhook deliveries.
+
+    Each key maps to the time it was first seen and its result: None while the first
+    delivery is still being processed, then the response content it produced.
+    """
+
+    def __init__(self, window_seconds: float = WEBHOOK_DEDUP_WINDOW_SECONDS, max_entries: int = WEBHOOK_DEDUP_MAX_ENTRIES):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+
+    def _prune(self, now: float) -> None:
+        while self._seen:
+            seen_at = next(iter(self._seen.values()))[0]
+            if now - seen_at < self.window_seconds and len(self._seen) <= self.max_entries:
+                break
+            self._seen.popitem(last=False)
+
+    def claim(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Register a delivery, or return the answer for a duplicate one.
+
+        Args:
+            key (str): The idempotency key of the delivery
+
+        Returns:
+            Optional[Dict[str, Any]]: None if the delivery is new and must be processed,
+                otherwise the completed result or an in-flight marker
+        """
+        now = time.time()
+        self._prune(now)
+        if key in self._seen:
+            result = self._seen[key][1]
+            return {**result, "duplicate": True} if result is not None else IN_FLIGHT
+        self._seen[key] = (now, None)
+        return None
+
+    def complete(self, key: str, result: Dict[str, Any]) -> None:
+        """Store the result of a processed delivery for later duplicates."""
+        if key in self._seen:
+            self._seen[key] = (self._seen[key][0], result)
+
+    def forget(self, key: str) -> None:
+        """Drop a delivery whose processing failed so a retry is processed again."""
+        self._seen.pop(key, None)
@@ -0,0 +1,272 @@
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from contextlib import aclosing
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional
+
+from google.adk.models import BaseLlm, LlmRequest
+from google.adk.models.registry import LLMRegistry
+from google.genai import types
+
+import metrics
+from deadline import MODEL_CALL_TIMEOUT_SECONDS, TOOL_CALL_TIMEOUT_SECONDS, stage_timeout
+from hedging import HedgedLlm
+
+logger = logging.getLogger(__name__)
+
+# Cheap model that summarises each chat (map) and merges the summaries (reduce)
+DIGEST_MODEL = os.getenv("DIGEST_MODEL", "gemini-2.0-flash-lite")
+# Chats fetched and summarised at the same time
+DIGEST_FANOUT = int(os.getenv("DIGEST_FANOUT", "8"))
+# Most recently active chats covered by one digest, and messages fetched per chat
+DIGEST_MAX_CHATS = int(os.getenv("DIGEST_MAX_CHATS", "50"))
+DIGEST_MESSAGES_PER_CHAT = int(os.getenv("DIGEST_MESSAGES_PER_CHAT", "100"))
+_CACHE_MAX_CHATS = 1000
+
+MAP_INSTRUCTION = (
+    "Summarise these WhatsApp messages from one chat in at most five short bullet points. "
+    "Keep decisions, dates, requests and anything that needs the reader's attention; "
+    "skip greetings and small talk. Answer in the language of the messages."
+)
+REDUCE_INSTRUCTION = (
+    "Merge these per-chat summaries of WhatsApp chats into one digest for the reader. "
+    "Lead with what needs their attention, then one short section per chat that had "
+    "something worth reading, with the chat name in bold. Leave out chats with nothing notable. "
+    "Use WhatsApp formatting (*bold*, bullet points) and answer in the language of the summaries."
+)
+
+
+class _Segment(NamedTuple):
+    """Summary of a run of consecutive messages of a chat."""
+    first: datetime
+    last: datetime
+    ids: FrozenSet[str]
+    summary: str
+
+
+class _ChatDigest(NamedTuple):
+    # Every message of the chat from covered_from to the last segment is in a segment
+    covered_from: datetime
+    segments: List[_Segment]
+
+
+def _parse_time(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _tool_json(result) -> Any:
+    """Decode the result of a WhatsApp MCP tool: a text part "Retrieved N ...:" followed by JSON."""
+    text = "".join(part.text for part in result.content if getattr(part, "text", None))
+    if result.isError:
+        raise RuntimeError(text)
+    _, _, payload = text.partition("\n")
+    return json.loads(payload)
+
+
+def _render(messages: List[Dict[str, Any]]) -> str:
+    lines = []
+    for message in messages:
+        sender = "me" if message.get("fromMe") else (message.get("contact") or "someone")
+        sent_at = _parse_time(message.get("timestamp"))
+        body = (message.get("body") or "").strip() or "[media]"
+        lines.append(f"[{sent_at:%Y-%m-%d %H:%M}] {sender}: {body}")
+    return "\n".join(lines)
+
+
+class DigestEngine:
+    """
+    Summarises many chats at once, map-reduce style.
+
+    The active chats are fetched and summarised concurrently, at most DIGEST_FANOUT at a
+    time, each by one call to the cheap DIGEST_MODEL; one more call merges the summaries.
+    Summaries are cached per chat as segments of consecutive messages, so a later digest
+    (asked again, or scheduled) only summarises messages no earlier digest has seen, and
+    does not fetch chats without new messages at all.
+
+    The chats are read over the agent's MCP session pool, so digests share its sessions
+    and reconnects.
+    """
+
+    def __init__(self, fanout: int = DIGEST_FANOUT, max_chats: int = DIGEST_MAX_CHATS,
+                 messages_per_chat: int = DIGEST_MESSAGES_PER_CHAT):
+        self.fanout = max(1, fanout)
+        self.max_chats = max_chats
+        self.messages_per_chat = messages_per_chat
+        self._pool = None
+        self._model: Optional[BaseLlm] = None
+        self._cache: "OrderedDict[str, _ChatDigest]" = OrderedDict()
+
+    def attach(self, pool, model: Optional[BaseLlm] = None) -> None:
+        """
+        Give the engine its MCP session pool and, optionally, a model to use instead of DIGEST_MODEL.
+
+        Args:
+            pool (MCPSessionPool): Sessions to the WhatsApp MCP server
+            model (Optional[BaseLlm]): The model for map and reduce calls
+        """
+        self._pool = pool
+        if model is not None:
+            self._model = HedgedLlm(model, target="digest_model")
+
+    @property
+    def model(self) -> BaseLlm:
+        if self._model is None:
+            self._model = HedgedLlm(LLMRegistry.new_llm(DIGEST_MODEL), target="digest_model")
+        return self._model
+
+    async def _call_tool(self, name: str, args: Dict[str, Any]) -> Any:
+        if self._pool is None:
+            raise RuntimeError("The digest engine is not connected to the WhatsApp MCP server")
+        async with self._pool.session() as session:
+            result = await asyncio.wait_for(session.call_tool(name, args), stage_timeout(TOOL_CALL_TIMEOUT_SECONDS))
+        return _tool_json(result)
+
+    async def _generate(self, instruction: str, text: str, max_output_tokens: int) -> str:
+        config = types.GenerateContentConfig(
+            system_instruction=instruction,
+            max_output_tokens=max_output_tokens,
+            temperature=0.2,
+            http_options=types.HttpOptions(timeout=int(stage_timeout(MODEL_CALL_TIMEOUT_SECONDS) * 1000)),
+        )
+        request = LlmRequest(
+            model=self.model.model,
+            contents=[types.Content(role="user", parts=[types.Part(text=text)])],
+            config=config,
+        )
+        parts: List[str] = []
+        async with aclosing(self.model.generate_content_async(request)) as responses:
+            async for response in responses:
+                if response.error_code:
+                    raise RuntimeError(f"{response.error_code}: {response.error_message}")
+                if response.content and response.content.parts:
+                    parts.extend(part.text for part in response.content.parts if part.text)
+        return "".join(parts).strip()
+
+    async def _summarize(self, messages: List[Dict[str, Any]], semaphore: asyncio.Semaphore) -> _Segment:
+        async with semaphore:
+            with metrics.stage("digest_map"):
+                summary = await self._generate(MAP_INSTRUCTION, _render(messages), 400)
+        times = [_parse_time(message["timestamp"]) for message in messages]
+        return _Segment(min(times), max(times), frozenset(message["id"] for message in messages), summary)
+
+    async def _digest_chat(self, chat: Dict[str, Any], since: datetime, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        """Summary of one chat's messages since a time, reusing and extending its cached segments."""
+        chat_id = chat["id"]
+        cached = self._cache.get(chat_id)
+        segments = [segment for segment in cached.segments if segment.first >= since] if cached else []
+        report = {"chat": chat.get("name") or chat_id, "new_messages": 0, "truncated": False}
+
+        up_to_date = (
+            cached is not None and cached.covered_from <= since and segments
+            # A dropped segment that started before since also held messages after it
+            and len(segments) == sum(1 for segment in cached.segments if segment.last >= since)
+            and _parse_time(chat.get("timestamp")) <= segments[-1].last
+        )
+        if not up_to_date:
+            async with semaphore:
+                with metrics.stage("digest_fetch"):
+                    if chat_id.endswith("@g.us"):
+                        messages = await self._call_tool("get_group_messages", {"groupId": chat_id, "limit": self.messages_per_chat})
+                    else:
+                        messages = await self._call_tool("get_messages", {"number": chat_id, "limit": self.messages_per_chat})
+            dated = [message for message in messages if message.get("id") and _parse_time(message.get("timestamp"))]
+            dated.sort(key=lambda message: _parse_time(message["timestamp"]))
+            window = [message for message in dated if _parse_time(message["timestamp"]) >= since]
+            # The chat had more messages since then than were fetched
+            report["truncated"] = len(messages) >= self.messages_per_chat and len(window) == len(dated)
+
+            covered = frozenset().union(*(segment.ids for segment in segments))
+            new = [message for message in window if message["id"] not in covered]
+            report["new_messages"] = len(new)
+            # New messages are older than the cached segments (an earlier digest started later) or newer
+            head = [message for message in new if segments and _parse_time(message["timestamp"]) < segments[0].first]
+            tail = new[len(head):]
+            summarized = await asyncio.gather(*(self._summarize(batch, semaphore) for batch in (head, tail) if batch))
+            if head:
+                segments = [summarized[0]] + segments
+            if tail:
+                segments = segments + [summarized[-1]]
+            self._cache[chat_id] = _ChatDigest(since, segments)
+
+        self._cache.move_to_end(chat_id)
+        while len(self._cache) > _CACHE_MAX_CHATS:
+            self._cache.popitem(last=False)
+        report["summary"] = "\n".join(segment.summary for segment in segments)
+        report["messages"] = sum(len(segment.ids) for segment in segments)
+        return report
+
+    async def digest(self, since_hours: float = 24.0, groups_only: bool = True, chat_filter: str = "", focus: str = "") -> Dict[str, Any]:
+        """
+        Build a digest of the chats active in the last since_hours.
+
+        Args:
+            since_hours (float): How far back to look, in hours
+            groups_only (bool): Only cover group chats
+            chat_filter (str): Only cover chats whose name contains this text (case-insensitive)
+            focus (str): What the digest should concentrate on, if anything
+
+        Returns:
+            Dict[str, Any]: The digest text and how many chats and new messages it covered
+        """
+        since = datetime.now(timezone.utc) - timedelta(hours=since_hours)
+        with metrics.stage("digest_fetch"):
+            chats = await self._call_tool("get_chats", {})
+        active = []
+        for chat in chats:
+            last_message_at = _parse_time(chat.get("timestamp"))
+            if not chat.get("id") or last_message_at is None or last_message_at < since:
+                continue
+            if groups_only and not chat["id"].endswith("@g.us"):
+                continue
+            if chat_filter and chat_filter.lower() not in (chat.get("name") or "").lower():
+                continue
+            active.append(chat)
+        active.sort(key=lambda chat: _parse_time(chat["timestamp"]), reverse=True)
+        skipped = max(len(active) - self.max_chats, 0)
+        active = active[:self.max_chats]
+
+        semaphore = asyncio.Semaphore(self.fanout)
+        results = await asyncio.gather(*(self._digest_chat(chat, since, semaphore) for chat in active), return_exceptions=True)
+        reports, failed = [], []
+        for chat, result in zip(active, results):
+            if isinstance(result, BaseException):
+                logger.warning("Digest of chat %s failed: %r", chat["id"], result)
+                failed.append(chat.get("name") or chat["id"])
+            elif result["summary"]:
+                reports.append(result)
+
+        response: Dict[str, Any] = {
+            "success": True,
+            "since": since.isoformat(timespec="minutes"),
+            "chats_covered": len(reports),
+            "new_messages_summarized": sum(report["new_messages"] for report in reports),
+        }
+        if skipped:
+            response["chats_not_covered"] = skipped
+        if failed:
+            response["failed_chats"] = failed
+        truncated = [report["chat"] for report in reports if report["truncated"]]
+        if truncated:
+            response["only_latest_messages_covered"] = truncated
+        if not reports:
+            response["digest"] = "No messages in the selected chats during this period."
+            return response
+
+        summaries = "\n\n".join(f"Chat: {report['chat']} ({report['messages']} messages)\n{report['summary']}" for report in reports)
+        instruction = REDUCE_INSTRUCTION + (f" Concentrate on: {focus}" if focus else "")
+        with metrics.stage("digest_reduce"):
+            response["digest"] = await self._generate(instruction, summaries, 1500)
+        return response
+
+
+# Shared by every digest of this process, so the per-chat summaries are reused
+digest_engine = DigestEngine()
@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import time
+from collections import deque
+from contextlib import aclosing, suppress
+from typing import AsyncGenerator, Callable, List, Optional, TypeVar
+
+import httpx
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from pydantic import PrivateAttr
+
+import metrics
+from admission import ModelCallFailed
+from deadline import DeadlineExceeded, time_left
+
+logger = logging.getLogger(__name__)
+
+# Send a duplicate of a model call that has not answered by the MODEL_HEDGE_PERCENTILE latency
+MODEL_HEDGING_ENABLED = os.getenv("MODEL_HEDGING_ENABLED", "false").lower() == "true"
+MODEL_HEDGE_PERCENTILE = float(os.getenv("MODEL_HEDGE_PERCENTILE", "90"))
+# Most model calls, in percent, that may be hedged
+MODEL_HEDGE_BUDGET_PERCENT = float(os.getenv("MODEL_HEDGE_BUDGET_PERCENT", "10"))
+# Retries of a model call that failed with a transient error (rate limit, 5xx, network)
+MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "2"))
+MODEL_RETRY_BACKOFF_SECONDS = float(os.getenv("MODEL_RETRY_BACKOFF_SECONDS", "0.5"))
+# Latencies (and hedging decisions) remembered per target, and the fewest needed to hedge at all
+_WINDOW = 200
+_MIN_SAMPLES = 20
+# HTTP status codes of Gemini (google.genai and google.api_core) errors worth retrying
+_TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+
+T = TypeVar("T")
+# Marks the end of an attempt's responses
+_END = object()
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed model call may succeed if sent again. A turn out of time never does."""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if getattr(error, "code", None) in _TRANSIENT_CODES:
+        return True
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+class HedgePolicy:
+    """
+    Latency history and hedge budget of one kind of model call.
+
+    The hedge delay is the MODEL_HEDGE_PERCENTILE latency of the last calls; no call is
+    hedged before _MIN_SAMPLES are known. At most MODEL_HEDGE_BUDGET_PERCENT of the
+    last calls may have been hedged, so a slow backend sees at most that much extra load.
+    """
+
+    def __init__(self, target: str, enabled: bool = MODEL_HEDGING_ENABLED,
+                 percentile: float = MODEL_HEDGE_PERCENTILE, budget_percent: float = MODEL_HEDGE_BUDGET_PERCENT):
+        self.target = target
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget_percent / 100
+        self._latencies: deque = deque(maxlen=_WINDOW)
+        self._hedged: deque = deque(maxlen=_WINDOW)
+        self._hedged_count = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a call should be hedged, or None if it must not be."""
+        if not self.enabled or len(self._latencies) < _MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[max(math.ceil(self.percentile / 100 * len(ordered)) - 1, 0)]
+
+    def allow_hedge(self) -> bool:
+        """Whether a duplicate may be sent now: within the budget, and while the turn has time left."""
+        left = time_left()
+        if left is not None and left <= 0:
+            return False
+        return self._hedged_count + 1 <= self.budget * (len(self._hedged) + 1)
+
+    def observe(self, latency: float, hedged: bool) -> None:
+        """Record a finished call: its latency to the first answer, and whether it was hedged."""
+        self._latencies.append(latency)
+        if len(self._hedged) == self._hedged.maxlen:
+            self._hedged_count -= self._hedged[0]
+        self._hedged.append(hedged)
+        self._hedged_count += hedged
+
+    def retry_delay(self, attempt: int, error: BaseException) -> Optional[float]:
+        """
+        Backoff before retrying a failed call, or None if it must not be retried:
+        the error is not transient, the retries are used up or the turn has no time left.
+        """
+        if attempt >= MODEL_MAX_RETRIES or not is_transient(error):
+            return None
+        delay = MODEL_RETRY_BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5)
+        left = time_left()
+        if left is not None and left <= delay:
+            return None
+        metrics.MODEL_RETRIES.labels(target=self.target).inc()
+        logger.warning("%s call failed (%r), retry %d in %.2fs", self.target, error, attempt + 1, delay)
+        return delay
+
+
+async def hedged_call(fn: Callable[[], T], policy: HedgePolicy) -> T:
+    """
+    Run a blocking model call in a thread, with retries and, if enabled, hedging.
+
+    The event loop keeps serving other turns meanwhile, backoff included. When the call
+    has not returned after the policy's hedge delay, an identical call is started in
+    another thread and the first successful result is returned. The slower call cannot
+    be interrupted; it finishes in the background and its result is dropped.
+
+    Args:
+        fn (Callable[[], T]): The call, e.g. a generate_content() closure
+        policy (HedgePolicy): Latency history and budget of this kind of call
+
+    Returns:
+        T: The result of the first call to succeed
+    """
+    attempt = 0
+    while True:
+        try:
+            return await _hedged_once(fn, policy)
+        except Exception as e:
+            delay = policy.retry_delay(attempt, e)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+async def _hedged_once(fn: Callable[[], T], policy: HedgePolicy) -> T:
+    started = time.monotonic()
+    delay = policy.hedge_delay()
+    # to_thread gives the thread a copy of the context, so the turn's deadline and trace id follow the call
+    primary = asyncio.ensure_future(asyncio.to_thread(fn))
+    attempts = [primary]
+    if delay is not None:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if not done and policy.allow_hedge():
+            attempts.append(asyncio.ensure_future(asyncio.to_thread(fn)))
+    errors: List[BaseException] = []
+    pending = set(attempts)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                    continue
+                hedged = len(attempts) > 1
+                if hedged:
+                    metrics.MODEL_HEDGES.labels(target=policy.target, result="won" if task is not primary else "lost").inc()
+                policy.observe(time.monotonic() - started, hedged)
+                return task.result()
+        raise errors[0]
+    finally:
+        # Only drops the result: the thread itself runs to the end
+        for task in pending:
+            task.cancel()
+
+
+class HedgedLlm(BaseLlm):
+    """
+    Wraps the agent's model with retries and, if enabled, hedging of each model call.
+
+    Hedging applies to the model calls runner.run_async() makes, not to the run as a
+    whole: a run also calls tools, which have side effects, while a model call is a
+    pure request that can safely be sent twice. A call is hedged until the first
+    response (the first chunk, when streaming) arrives; the slower attempt is then
+    cancelled. A hedged call runs each attempt in a task of its own, which consumes the
+    model's stream and relays it through a queue. A call is only retried if it failed
+    before yielding anything. A call that still fails raises ModelCallFailed, which the
+    admission circuit breaker counts.
+    """
+
+    inner: BaseLlm
+    _policy: HedgePolicy = PrivateAttr()
+
+    def __init__(self, inner: BaseLlm, target: str = "agent_model", **kwargs):
+        super().__init__(model=inner.model, inner=inner, **kwargs)
+        self._policy = HedgePolicy(target)
+
+    @classmethod
+    def supported_models(cls) -> List[str]:
+        return []
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        attempt = 0
+        while True:
+            yielded = False
+            try:
+                async for response in self._hedged(llm_request, stream):
+                    yielded = True
+                    yield response
+                return
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                delay = None if yielded else self._policy.retry_delay(attempt, e)
+                if delay is None:
+                    raise ModelCallFailed(f"{self._policy.target} call failed: {e!r}") from e
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def _relay(self, index: int, llm_request: LlmRequest, stream: bool, chunks: asyncio.Queue) -> None:
+        """
+        Run one attempt: iterate the model's stream from start to end in this task, and pass
+        (index, response) to the caller through chunks, then (index, _END) or (index, error).
+        """
+        try:
+            async with aclosing(self.inner.generate_content_async(llm_request, stream=stream)) as responses:
+                async for response in responses:
+                    chunks.put_nowait((index, response))
+            chunks.put_nowait((index, _END))
+        except Exception as e:
+            chunks.put_nowait((index, e))
+
+    async def _hedged(self, llm_request: LlmRequest, stream: bool) -> AsyncGenerator[LlmResponse, None]:
+        started = time.monotonic()
+        delay = self._policy.hedge_delay()
+        if delay is None:
+            # Not hedged: iterate the model's stream in this task, which owns its context and cancellation
+            observed = False
+            async with aclosing(self.inner.generate_content_async(llm_request, stream=stream)) as responses:
+                async for response in responses:
+                    if not observed:
+                        self._policy.observe(time.monotonic() - started, hedged=False)
+                        observed = True
+                    yield response
+            return
+
+        # Every attempt's stream is iterated by its own task from start to end, so the context it
+        # sets up (OTel spans, ...) is entered and left in the same task; only responses cross over
+        chunks: asyncio.Queue = asyncio.Queue()
+        attempts = [asyncio.create_task(self._relay(0, llm_request, stream, chunks))]
+        hedge_at: Optional[float] = started + delay
+        running = {0}
+        errors: List[BaseException] = []
+        try:
+            while True:
+                try:
+                    timeout = None if hedge_at is None else max(hedge_at - time.monotonic(), 0)
+                    index, item = await asyncio.wait_for(chunks.get(), timeout)
+                except asyncio.TimeoutError:
+                    hedge_at = None
+                    if self._policy.allow_hedge():
+                        # The model mutates requests (labels, appended content): give the duplicate its own
+                        duplicate = llm_request.model_copy(update={
+                            "contents": list(llm_request.contents),
+                            "config": llm_request.config.model_copy(deep=True) if llm_request.config else None,
+                        })
+                        running.add(len(attempts))
+                        attempts.append(asyncio.create_task(self._relay(len(attempts), duplicate, stream, chunks)))
+                    continue
+                if not isinstance(item, Exception):
+                    break
+                errors.append(item)
+                running.discard(index)
+                if not running:
+                    raise errors[0]
+
+            # The first attempt to answer wins; the others are cancelled
+            winner = index
+            for loser, task in enumerate(attempts):
+                if loser != winner:
+                    task.cancel()
+            hedged = len(attempts) > 1
+            if hedged:
+                metrics.MODEL_HEDGES.labels(target=self._policy.target, result="won" if winner != 0 else "lost").inc()
+            self._policy.observe(time.monotonic() - started, hedged)
+            while item is not _END:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+                index, item = await chunks.get()
+                # Responses a loser relayed before it was cancelled
+                while index != winner:
+                    index, item = await chunks.get()
+        finally:
+            for task in attempts:
+                task.cancel()
+                with suppress(BaseException):
+                    await task
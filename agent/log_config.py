@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+import random
+from typing import Any, Optional
+
+import metrics
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" for human readable lines, "json" for one JSON object per line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Longest message / payload excerpt written to the logs
+LOG_PREVIEW_CHARS = int(os.getenv("LOG_PREVIEW_CHARS", "200"))
+# Fraction of per-event debug lines of an agent run that are actually logged
+LOG_EVENT_SAMPLE_RATE = float(os.getenv("LOG_EVENT_SAMPLE_RATE", "0.1"))
+
+# ADK loggers that write whole model requests and responses (system prompt and user messages
+# included) at INFO on every model call; only let them through at LOG_LEVEL=DEBUG
+VERBOSE_LIBRARY_LOGGERS = ("google_adk.google.adk.models.google_llm",)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s'
+
+
+class Preview:
+    """
+    Bounded, lazily rendered excerpt of a value for log arguments.
+
+    Nothing is converted to text unless the record is actually emitted, and at most
+    LOG_PREVIEW_CHARS characters end up in the log line.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: Optional[int] = None):
+        self.value = value
+        self.limit = LOG_PREVIEW_CHARS if limit is None else limit
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else repr(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... ({len(text)} chars)"
+
+
+def preview(value: Any, limit: Optional[int] = None) -> Preview:
+    """Wrap a value so it is logged as a bounded excerpt, formatted only if emitted."""
+    return Preview(value, limit)
+
+
+def sample(rate: float = LOG_EVENT_SAMPLE_RATE) -> bool:
+    """Return True for the given fraction of calls, to thin out verbose log lines."""
+    return rate >= 1 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "trace_id": getattr(record, "trace_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging() -> None:
+    """
+    Configure the root logger from LOG_LEVEL and LOG_FORMAT, with trace ids on every record.
+    Replaces the bare handlers tool modules install on import, and quiets the ADK
+    loggers that dump model payloads unless LOG_LEVEL is DEBUG.
+    """
+    logging.basicConfig(level=LOG_LEVEL, format=TEXT_FORMAT, force=True)
+    if LOG_FORMAT == "json":
+        for handler in logging.getLogger().handlers:
+            handler.setFormatter(JsonFormatter())
+    library_level = logging.DEBUG if LOG_LEVEL == "DEBUG" else logging.WARNING
+    for name in VERBOSE_LIBRARY_LOGGERS:
+        logging.getLogger(name).setLevel(library_level)
+    metrics.install_trace_id_logging()
@@ -0,0 +1,249 @@
+import asyncio
+import itertools
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import anyio
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.mcp_tool.mcp_session_manager import retry_on_closed_resource
+from google.adk.tools.mcp_tool.mcp_tool import MCPTool
+from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset, SseConnectionParams
+from google.adk.tools.tool_context import ToolContext
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+
+from deadline import TOOL_CALL_TIMEOUT_SECONDS, stage_timeout, time_left
+
+logger = logging.getLogger(__name__)
+
+# Number of SSE sessions kept open to the MCP server; concurrent tool calls are spread over them
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "1"))
+# Interval of the keepalive pings that detect dead sessions while the butler is idle
+MCP_KEEPALIVE_SECONDS = float(os.getenv("MCP_KEEPALIVE_SECONDS", "30"))
+MCP_PING_TIMEOUT_SECONDS = 5
+MCP_RECONNECT_BACKOFF_SECONDS = 0.5
+MCP_RECONNECT_MAX_BACKOFF_SECONDS = float(os.getenv("MCP_RECONNECT_MAX_BACKOFF_SECONDS", "30"))
+# Longest a tool call waits for a session while none is connected
+MCP_SESSION_WAIT_SECONDS = float(os.getenv("MCP_SESSION_WAIT_SECONDS", "10"))
+
+
+class MCPSessionPool:
+    """
+    A fixed number of MCP sessions, each owned by a task that keeps it alive.
+
+    Every slot task connects, pings its session every MCP_KEEPALIVE_SECONDS and, when
+    the connection drops or a ping fails, reconnects with exponential backoff. Opening
+    and closing a session happen in the same task, as the anyio cancel scopes of the
+    MCP client require. Tool calls get a connected session round-robin; a session a call
+    finds closed is taken out of rotation and pinged by its slot right away.
+
+    Implements the create_session()/close() interface of ADK's MCPSessionManager, so
+    it can stand in for it in MCPToolset and the MCPTools it creates.
+    """
+
+    def __init__(self, connection_params: SseConnectionParams, size: int = MCP_POOL_SIZE):
+        self.connection_params = connection_params
+        self.size = max(1, size)
+        # Incremented on every (re)connect, so cached tool lists can be refreshed
+        self.generation = 0
+        self._sessions: List[Optional[ClientSession]] = [None] * self.size
+        self._wakeups = [asyncio.Event() for _ in range(self.size)]
+        self._connected = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._round_robin = itertools.count()
+
+    @property
+    def connected(self) -> int:
+        """Number of sessions currently connected."""
+        return sum(1 for session in self._sessions if session is not None)
+
+    def start(self) -> None:
+        """Connect every slot in the background. Safe to call more than once."""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run_slot(index)) for index in range(self.size)]
+
+    async def _run_slot(self, index: int) -> None:
+        params = self.connection_params
+        backoff = MCP_RECONNECT_BACKOFF_SECONDS
+        while True:
+            try:
+                async with sse_client(
+                    url=params.url,
+                    headers=params.headers,
+                    timeout=params.timeout,
+                    sse_read_timeout=params.sse_read_timeout,
+                ) as streams:
+                    async with ClientSession(*streams[:2]) as session:
+                        await session.initialize()
+                        self._publish(index, session)
+                        backoff = MCP_RECONNECT_BACKOFF_SECONDS
+                        logger.info("MCP session %d connected to %s", index, params.url)
+                        await self._keepalive(index, session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The MCP client reports transport errors wrapped in task group errors
+                while isinstance(e, ExceptionGroup) and e.exceptions:
+                    e = e.exceptions[0]
+                logger.warning("MCP session %d lost (%r), reconnecting in %.1fs", index, e, backoff)
+            finally:
+                self._publish(index, None)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MCP_RECONNECT_MAX_BACKOFF_SECONDS)
+
+    async def _keepalive(self, index: int, session: ClientSession) -> None:
+        """Ping the session until a ping fails (e.g. ClosedResourceError or a timeout), which raises."""
+        wakeup = self._wakeups[index]
+        while True:
+            try:
+                await asyncio.wait_for(wakeup.wait(), MCP_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+            await asyncio.wait_for(session.send_ping(), MCP_PING_TIMEOUT_SECONDS)
+            if self._sessions[index] is None:
+                # Reported closed by a call, but it still answers
+                self._publish(index, session)
+
+    def _publish(self, index: int, session: Optional[ClientSession]) -> None:
+        self._sessions[index] = session
+        if session is not None:
+            self.generation += 1
+            self._connected.set()
+        elif not self.connected:
+            self._connected.clear()
+
+    def discard(self, session: ClientSession) -> None:
+        """Take a session a call found closed out of rotation, and have its slot ping it now."""
+        for index, published in enumerate(self._sessions):
+            if published is session:
+                self._publish(index, None)
+                self._wakeups[index].set()
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[ClientSession]:
+        """A connected session (see create_session), discarded if it turns out to be closed."""
+        session = await self.create_session()
+        try:
+            yield session
+        except anyio.ClosedResourceError:
+            self.discard(session)
+            raise
+
+    async def create_session(self, headers: Optional[Dict[str, str]] = None) -> ClientSession:
+        """
+        Get a connected session, waiting up to MCP_SESSION_WAIT_SECONDS for one.
+        headers are ignored: all sessions share the connection headers.
+
+        Raises:
+            ConnectionError: If no session connects in time
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + MCP_SESSION_WAIT_SECONDS
+        while True:
+            live = [session for session in self._sessions if session is not None]
+            if live:
+                return live[next(self._round_robin) % len(live)]
+            self._connected.clear()
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise ConnectionError(f"No MCP session to {self.connection_params.url} could be established")
+            try:
+                await asyncio.wait_for(self._connected.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+class DeadlineMCPTool(MCPTool):
+    """
+    MCPTool whose calls are bounded by TOOL_CALL_TIMEOUT_SECONDS and the turn's deadline.
+
+    A call that runs out of its own time is cancelled and reported to the model as an
+    error, so the turn can still answer with what it has. A call that runs into the
+    turn's deadline raises, and the turn is cancelled.
+    """
+
+    @retry_on_closed_resource
+    async def _run_async_impl(self, *, args: Dict[str, Any], tool_context: ToolContext, credential) -> Any:
+        # The pool's sessions share the connection headers, so the credential is not needed here
+        async with self._mcp_session_manager.session() as session:
+            return await session.call_tool(self.name, arguments=args)
+
+    async def run_async(self, *, args: Dict[str, Any], tool_context: ToolContext) -> Any:
+        timeout = stage_timeout(TOOL_CALL_TIMEOUT_SECONDS)
+        try:
+            async with asyncio.timeout(timeout):
+                return await super().run_async(args=args, tool_context=tool_context)
+        except TimeoutError:
+            left = time_left()
+            if left is not None and left <= 0:
+                raise
+            logger.warning("MCP tool %s timed out after %.1fs", self.name, timeout)
+            return {"error": f"The {self.name} tool did not answer within {timeout:.0f} seconds"}
+
+
+class PooledMCPToolset(MCPToolset):
+    """
+    MCPToolset backed by an MCPSessionPool, with its tool list cached and its tool
+    calls bounded by the turn's deadline.
+
+    ADK lists the tools of a toolset before every model call; the list is fetched once
+    per (re)connect instead. connect() opens the sessions and fetches the list eagerly,
+    so the first turn does not pay for the SSE handshake.
+    """
+
+    def __init__(self, *, connection_params: SseConnectionParams, pool_size: int = MCP_POOL_SIZE, **kwargs):
+        super().__init__(connection_params=connection_params, **kwargs)
+        self.pool = MCPSessionPool(connection_params, pool_size)
+        self._mcp_session_manager = self.pool
+        self._tools: Optional[List[BaseTool]] = None
+        self._tools_generation = -1
+        self._warmup: Optional[asyncio.Task] = None
+
+    def connect(self) -> None:
+        """Open the pool's sessions and fetch the tool list in the background."""
+        self.pool.start()
+        if self._warmup is None:
+            self._warmup = asyncio.create_task(self._warm())
+
+    async def _warm(self) -> None:
+        try:
+            tools = await self.get_tools()
+            logger.info("MCP toolset ready with %d tools", len(tools))
+        except Exception as e:
+            logger.warning("MCP tool list warm-up failed, retrying on first use: %s", e)
+
+    @retry_on_closed_resource
+    async def _list_tools(self) -> List[BaseTool]:
+        async with self.pool.session() as session:
+            response = await asyncio.wait_for(session.list_tools(), stage_timeout(TOOL_CALL_TIMEOUT_SECONDS))
+        return [
+            DeadlineMCPTool(
+                mcp_tool=tool,
+                mcp_session_manager=self.pool,
+                auth_scheme=self._auth_scheme,
+                auth_credential=self._auth_credential,
+            )
+            for tool in response.tools
+        ]
+
+    async def get_tools(self, readonly_context: Optional[ReadonlyContext] = None) -> List[BaseTool]:
+        if self._tools is None or self._tools_generation != self.pool.generation:
+            self._tools = await self._list_tools()
+            self._tools_generation = self.pool.generation
+        return [tool for tool in self._tools if self._is_tool_selected(tool, readonly_context)]
+
+    async def close(self) -> None:
+        if self._warmup is not None:
+            self._warmup.cancel()
+        await self.pool.close()
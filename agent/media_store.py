@@ -0,0 +1,305 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import metrics
+from deadline import TURN_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Where the WhatsApp API service downloads media (shared volume); empty disables eviction and dedup
+MEDIA_STORE_DIR = os.getenv("MEDIA_STORE_DIR", "/project/session-data/media")
+# Eviction deletes files from the WhatsApp session volume, so it is off unless one of these is set.
+# Disk quota of the media directory; the least recently used files are evicted above it (0: no quota)
+MEDIA_STORE_QUOTA_MB = float(os.getenv("MEDIA_STORE_QUOTA_MB", "0"))
+# Files unused for longer are evicted even below the quota (0: keep them)
+MEDIA_STORE_MAX_AGE_HOURS = float(os.getenv("MEDIA_STORE_MAX_AGE_HOURS", "0"))
+MEDIA_STORE_SWEEP_SECONDS = float(os.getenv("MEDIA_STORE_SWEEP_SECONDS", "600"))
+# How long after a media message a later message of the chat may still refer to it
+MEDIA_CONTEXT_SECONDS = 300
+# Files used this recently may still be in the media context of a turn, and are never evicted
+_IN_USE_SECONDS = MEDIA_CONTEXT_SECONDS + TURN_TIMEOUT_SECONDS
+# A use does not rewrite an access time set more recently than this: the file then stays
+# protected for at least MEDIA_CONTEXT_SECONDS after the use
+_TOUCH_INTERVAL_SECONDS = TURN_TIMEOUT_SECONDS
+# Hard links named by content hash, shared by every file with that content
+_BLOB_DIR = ".blobs"
+_INDEX_MAX_ENTRIES = 10000
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+
+
+class _Entry(NamedTuple):
+    mtime_ns: int
+    checked_at: float
+    info: Dict[str, Any]
+
+
+def _content_hash(file_path: str) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _probe(file_path: str, stats: os.stat_result) -> Dict[str, Any]:
+    """File information as returned by check_file_exists/get_file_info, from the stat and the image header."""
+    _, ext = os.path.splitext(file_path)
+    info: Dict[str, Any] = {
+        "exists": True,
+        "path": file_path,
+        "size": stats.st_size,
+        "extension": ext.lower(),
+        "is_image": ext.lower() in IMAGE_EXTENSIONS,
+        "readable": os.access(file_path, os.R_OK),
+    }
+    if info["is_image"]:
+        try:
+            from PIL import Image
+            # Image.open only parses the header; the pixels are never decoded
+            with Image.open(file_path) as img:
+                info["image_width"] = img.width
+                info["image_height"] = img.height
+                info["image_mode"] = img.mode
+                info["image_format"] = img.format
+        except ImportError:
+            info["note"] = "PIL not available for detailed image analysis"
+        except Exception as img_error:
+            info["image_error"] = str(img_error)
+    return info
+
+
+class MediaStore:
+    """
+    Keeps the downloaded media directory within its quota and answers file checks from memory.
+
+    The last use of a file is its access time, set explicitly whenever the butler ingests,
+    checks or analyses it (unless already set within a turn's time budget), so every worker
+    process (and a restarted one) sees the same LRU order. Sweeps, one at a time, evict files unused for MEDIA_STORE_MAX_AGE_HOURS, then the least recently
+    used ones until the directory fits MEDIA_STORE_QUOTA_MB. Files used within the media
+    context window (plus a turn's time budget) are never evicted, since a chat may still
+    refer to them.
+
+    Files with the same content are stored once: an ingested file whose content hash is
+    already in .blobs/ is replaced by a hard link to that blob, so every path the WhatsApp
+    API handed out stays valid.
+
+    File information is indexed by path and mtime. A check within MEDIA_CONTEXT_SECONDS of
+    the last one is answered without I/O; the file cannot have been evicted meanwhile, as
+    that check marked it in use. Later checks stat the file, and parse its header again
+    only if its mtime changed.
+    """
+
+    def __init__(self, root: str = MEDIA_STORE_DIR, quota_mb: float = MEDIA_STORE_QUOTA_MB,
+                 max_age_hours: float = MEDIA_STORE_MAX_AGE_HOURS):
+        self.root = os.path.realpath(root) if root else ""
+        self.quota_bytes = int(quota_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_hours * 3600
+        self._index: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Sweeps run from the periodic task and from ingest() in worker threads, one at a time
+        self._sweep_lock = threading.Lock()
+        # Size of the directory as of the last sweep, plus what was ingested since
+        self._bytes = 0
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def _in_store(self, file_path: str) -> bool:
+        return bool(self.root) and os.path.realpath(file_path).startswith(self.root + os.sep)
+
+    def _touch(self, file_path: str, stats: os.stat_result) -> None:
+        """
+        Mark a file in use by setting its access time, unless it was set within
+        _TOUCH_INTERVAL_SECONDS; its mtime, the index key, is kept.
+        """
+        if not self._in_store(file_path) or time.time() - stats.st_atime < _TOUCH_INTERVAL_SECONDS:
+            return
+        try:
+            os.utime(file_path, ns=(time.time_ns(), stats.st_mtime_ns))
+        except OSError as e:
+            logger.debug("Could not mark %s in use: %s", file_path, e)
+
+    def _forget(self, file_path: str) -> None:
+        with self._lock:
+            self._index.pop(file_path, None)
+
+    def describe(self, file_path: str) -> Dict[str, Any]:
+        """
+        Get information about a media file, from the index when possible, and mark it in use.
+
+        Args:
+            file_path (str): The absolute path to the file
+
+        Returns:
+            Dict[str, Any]: exists, path, size, extension, is_image and readable, plus the
+                image dimensions, mode and format for images; exists False and an error if
+                the file is missing
+
+        Raises:
+            OSError: If the file exists but cannot be inspected
+        """
+        now = time.monotonic()
+        entry = self._index.get(file_path)
+        if entry is not None and now - entry.checked_at < MEDIA_CONTEXT_SECONDS:
+            return dict(entry.info)
+
+        try:
+            stats = os.stat(file_path)
+        except FileNotFoundError:
+            self._forget(file_path)
+            return {"exists": False, "path": file_path, "error": "File not found"}
+        info = entry.info if entry is not None and entry.mtime_ns == stats.st_mtime_ns else _probe(file_path, stats)
+        self._touch(file_path, stats)
+        with self._lock:
+            self._index[file_path] = _Entry(stats.st_mtime_ns, now, info)
+            self._index.move_to_end(file_path)
+            while len(self._index) > _INDEX_MAX_ENTRIES:
+                self._index.popitem(last=False)
+        return dict(info)
+
+    def ingest(self, file_path: str) -> Dict[str, Any]:
+        """
+        Register a newly downloaded file: store its content once, index it and mark it in use.
+        Files outside the store directory are only described.
+
+        Args:
+            file_path (str): The path from the message's mediaInfo
+
+        Returns:
+            Dict[str, Any]: The file information, as returned by describe()
+        """
+        if not self._in_store(file_path):
+            return self.describe(file_path)
+        try:
+            size = os.stat(file_path).st_size
+            blob = os.path.join(self.root, _BLOB_DIR, _content_hash(file_path))
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            try:
+                os.link(file_path, blob)
+                with self._lock:
+                    self._bytes += size
+            except FileExistsError:
+                if not os.path.samefile(blob, file_path):
+                    # Swap atomically, so the path never disappears for a concurrent reader
+                    temporary = f"{file_path}.dedup"
+                    os.link(blob, temporary)
+                    os.replace(temporary, file_path)
+                    metrics.MEDIA_DEDUPLICATED_BYTES.inc(size)
+                    logger.info("Deduplicated %s (%d bytes) against %s", file_path, size, blob)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Could not deduplicate %s: %s", file_path, e)
+
+        self._forget(file_path)
+        info = self.describe(file_path)
+        if self.quota_bytes and self._bytes > self.quota_bytes:
+            self.sweep()
+        return info
+
+    def _scan(self) -> Dict[Tuple[int, int], Tuple[os.stat_result, List[str]]]:
+        """Files of the store directory and its blobs, grouped by inode (all links of one content)."""
+        inodes: Dict[Tuple[int, int], Tuple[os.stat_result, List[str]]] = {}
+        for directory in (self.root, os.path.join(self.root, _BLOB_DIR)):
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stats = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                inodes.setdefault((stats.st_dev, stats.st_ino), (stats, []))[1].append(entry.path)
+        return inodes
+
+    def sweep(self) -> Dict[str, int]:
+        """
+        Evict files unused for longer than the maximum age, then the least recently used
+        ones until the directory fits its quota. Files in use are kept even over quota.
+
+        Returns:
+            Dict[str, int]: Files evicted for age and for quota, and bytes left in the directory
+        """
+        evicted = {"age": 0, "quota": 0}
+        if not self.root:
+            return {**evicted, "bytes": 0}
+        with self._sweep_lock:
+            return self._sweep(evicted)
+
+    def _sweep(self, evicted: Dict[str, int]) -> Dict[str, int]:
+        inodes = self._scan()
+        total = sum(stats.st_size for stats, _ in inodes.values())
+        now = time.time()
+        # Least recently used first
+        for stats, paths in sorted(inodes.values(), key=lambda item: max(item[0].st_atime, item[0].st_mtime)):
+            idle = now - max(stats.st_atime, stats.st_mtime)
+            if idle < _IN_USE_SECONDS:
+                break
+            if self.max_age_seconds and idle > self.max_age_seconds:
+                reason = "age"
+            elif self.quota_bytes and total > self.quota_bytes:
+                reason = "quota"
+            else:
+                break
+            for path in paths:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning("Could not evict %s: %s", path, e)
+                self._forget(path)
+            total -= stats.st_size
+            evicted[reason] += 1
+            metrics.MEDIA_EVICTIONS.labels(reason=reason).inc()
+
+        with self._lock:
+            # Files ingested since the scan are missed until the next one
+            self._bytes = total
+        metrics.MEDIA_STORE_BYTES.set(total)
+        if self.quota_bytes and total > self.quota_bytes:
+            logger.warning("Media store holds %d bytes, over its %d byte quota, in files still in use", total, self.quota_bytes)
+        if evicted["age"] or evicted["quota"]:
+            logger.info("Media store sweep evicted %d files (%d by age, %d over quota), %d bytes left",
+                        evicted["age"] + evicted["quota"], evicted["age"], evicted["quota"], total)
+        return {**evicted, "bytes": total}
+
+    @property
+    def evicting(self) -> bool:
+        return bool(self.root) and bool(self.quota_bytes or self.max_age_seconds)
+
+    def start(self) -> None:
+        """Sweep every MEDIA_STORE_SWEEP_SECONDS in the background, if eviction is on. Safe to call more than once."""
+        if not self.evicting:
+            if self.root:
+                logger.info("Media store eviction is off (MEDIA_STORE_QUOTA_MB and MEDIA_STORE_MAX_AGE_HOURS unset)")
+        elif self._sweeper is None:
+            logger.warning("Media store evicts files from %s: quota %s, maximum age %s", self.root,
+                           f"{self.quota_bytes // (1024 * 1024)} MB" if self.quota_bytes else "none",
+                           f"{self.max_age_seconds / 3600:g} hours" if self.max_age_seconds else "none")
+            self._sweeper = asyncio.create_task(self._sweep_periodically())
+
+    async def _sweep_periodically(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error("Media store sweep failed: %s", e)
+            await asyncio.sleep(MEDIA_STORE_SWEEP_SECONDS)
+
+    def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+
+# Shared by the webhook server, the agent and the media tools of this process
+media_store = MediaStore()
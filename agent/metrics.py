@@ -0,0 +1,168 @@
+import contextvars
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Trace id of the turn being processed, attached to every log record
+trace_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="-")
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+_TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+TURN_LATENCY = Histogram(
+    "butler_turn_latency_seconds",
+    "End-to-end latency of an agent turn",
+    ["kind", "outcome"],
+    buckets=_LATENCY_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "butler_stage_latency_seconds",
+    "Time spent in each stage of a turn (session, model, tool, media_model, whatsapp_send, queue_wait)",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+TOOL_LATENCY = Histogram(
+    "butler_tool_latency_seconds",
+    "Time spent in each agent tool",
+    ["tool"],
+    buckets=_LATENCY_BUCKETS,
+)
+TOKENS = Histogram(
+    "butler_model_tokens",
+    "Tokens per model call",
+    ["direction"],
+    buckets=_TOKEN_BUCKETS,
+)
+INPUT_TOKENS_TOTAL = Counter(
+    "butler_input_tokens_total",
+    "Input tokens sent to the model, split by prompt cache hit",
+    ["cache"],
+)
+MODEL_HEDGES = Counter(
+    "butler_model_hedges_total",
+    "Duplicate model requests sent after the hedge delay, by whether the duplicate answered first",
+    ["target", "result"],
+)
+MODEL_RETRIES = Counter(
+    "butler_model_retries_total",
+    "Model calls retried after a transient error",
+    ["target"],
+)
+MEDIA_STORE_BYTES = Gauge(
+    "butler_media_store_bytes",
+    "Size of the downloaded media directory as of the last sweep",
+    multiprocess_mode="max",
+)
+MEDIA_EVICTIONS = Counter(
+    "butler_media_evictions_total",
+    "Media files evicted from the store, by reason (age, quota)",
+    ["reason"],
+)
+MEDIA_DEDUPLICATED_BYTES = Counter(
+    "butler_media_deduplicated_bytes_total",
+    "Bytes of downloaded media replaced by a link to an identical file",
+)
+
+# Start times of model and tool calls in flight, keyed by invocation / function call id
+_model_started: Dict[str, float] = {}
+_tool_started: Dict[str, float] = {}
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds the current trace id to log records as %(trace_id)s."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get()
+        return True
+
+
+def install_trace_id_logging() -> None:
+    """Attach the trace id filter to every handler of the root logger."""
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(f, TraceIdFilter) for f in handler.filters):
+            handler.addFilter(TraceIdFilter())
+
+
+def new_trace_id() -> str:
+    """Start a new trace for the current task and return its id."""
+    trace_id = uuid.uuid4().hex[:16]
+    trace_id_var.set(trace_id)
+    return trace_id
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a stage of the current turn.
+
+    Args:
+        name (str): The stage name used as the metric label
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_LATENCY.labels(stage=name).observe(elapsed)
+        logger.debug("  [Span] %s: %.1f ms", name, elapsed * 1000)
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    """Record the duration of a stage that was timed elsewhere."""
+    STAGE_LATENCY.labels(stage=name).observe(seconds)
+
+
+def observe_tokens(usage: Dict[str, int]) -> None:
+    """Record the token usage of one model call (as returned by prompt_cache.record_usage)."""
+    TOKENS.labels(direction="in").observe(usage["input_tokens"])
+    TOKENS.labels(direction="out").observe(usage["output_tokens"])
+    INPUT_TOKENS_TOTAL.labels(cache="hit").inc(usage["cached_input_tokens"])
+    INPUT_TOKENS_TOTAL.labels(cache="miss").inc(usage["uncached_input_tokens"])
+
+
+# Entries of calls that raised never get popped; keep the maps bounded anyway
+_MAX_PENDING_CALLS = 1000
+
+
+def before_model_callback(callback_context, llm_request) -> None:
+    if len(_model_started) > _MAX_PENDING_CALLS:
+        _model_started.clear()
+    _model_started[callback_context.invocation_id] = time.perf_counter()
+    return None
+
+
+def after_model_callback(callback_context, llm_response) -> None:
+    # Streaming emits several partial responses per call; the call ends with the first non-partial one
+    if getattr(llm_response, "partial", False):
+        return None
+    started = _model_started.pop(callback_context.invocation_id, None)
+    if started is not None:
+        observe_stage("model", time.perf_counter() - started)
+    return None
+
+
+def _tool_key(tool_context) -> str:
+    return f"{tool_context.invocation_id}:{tool_context.function_call_id}"
+
+
+def before_tool_callback(tool, args, tool_context) -> Optional[dict]:
+    if len(_tool_started) > _MAX_PENDING_CALLS:
+        _tool_started.clear()
+    _tool_started[_tool_key(tool_context)] = time.perf_counter()
+    return None
+
+
+def after_tool_callback(tool, args, tool_context, tool_response) -> Optional[dict]:
+    started = _tool_started.pop(_tool_key(tool_context), None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        TOOL_LATENCY.labels(tool=tool.name).observe(elapsed)
+        observe_stage("tool", elapsed)
+        logger.info("  [Tool] %s: %.1f ms", tool.name, elapsed * 1000)
+    return None
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bearer token of the admin profiling endpoints; profiling is unavailable while unset
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN", "")
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "/tmp/butler-profiles")
+# Sampling interval of the profiler
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+# Most turns a single request may arm, and minimum spacing between two arm requests
+PROFILE_MAX_TURNS = 20
+PROFILE_ARM_MIN_INTERVAL_SECONDS = 60
+PROFILE_TOP_N = 20
+
+
+class ProfilingRateLimited(Exception):
+    """Raised when profiling is armed again too soon."""
+
+
+def _hot_functions(root_frame, top_n: int = PROFILE_TOP_N) -> List[Dict[str, Any]]:
+    """Aggregate self time per function over a pyinstrument frame tree."""
+    totals: Dict[tuple, float] = {}
+    stack = [root_frame] if root_frame is not None else []
+    while stack:
+        frame = stack.pop()
+        key = (frame.function, frame.file_path_short, frame.line_no)
+        totals[key] = totals.get(key, 0.0) + frame.total_self_time
+        stack.extend(frame.children)
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top_n]
+    return [
+        {"function": function, "file": file_path, "line": line_no, "self_seconds": round(seconds, 4)}
+        for (function, file_path, line_no), seconds in ranked
+    ]
+
+
+class TurnProfiler:
+    """
+    Profiles the next N turns, optionally only those of one chat, with pyinstrument.
+
+    Turns are profiled one at a time in async-aware mode from inside process_burst, so
+    the samples cover the chat's coalesced turn (call_agent_async, the tools and the
+    reply) but not unrelated turns running concurrently, nor the webhook handlers
+    waiting on the turn. While nothing is armed, profile()
+    costs a single attribute check and pyinstrument is never imported.
+    """
+
+    def __init__(self, output_dir: str = PROFILE_OUTPUT_DIR, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.output_dir = output_dir
+        self.interval_ms = interval_ms
+        self.remaining = 0
+        self.chat_id: Optional[str] = None
+        self.reports = deque(maxlen=PROFILE_MAX_TURNS)
+        self._active = False
+        self._last_armed_at = 0.0
+
+    def arm(self, turns: int, chat_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Profile the next turns (of chat_id only, if given). turns=0 disarms.
+
+        Raises:
+            ProfilingRateLimited: If profiling was armed less than a minute ago
+            ImportError: If pyinstrument is not installed
+        """
+        if turns > 0:
+            now = time.monotonic()
+            if now - self._last_armed_at < PROFILE_ARM_MIN_INTERVAL_SECONDS:
+                raise ProfilingRateLimited(f"profiling can be armed once every {PROFILE_ARM_MIN_INTERVAL_SECONDS}s")
+            import pyinstrument  # noqa: F401 -- fail at arm time rather than during a turn
+            self._last_armed_at = now
+        self.remaining = max(0, min(turns, PROFILE_MAX_TURNS))
+        self.chat_id = chat_id or None
+        logger.info("Profiling armed for %d turn(s)%s", self.remaining, f" of chat {self.chat_id}" if self.chat_id else "")
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "remaining_turns": self.remaining,
+            "chat_id": self.chat_id,
+            "output_dir": self.output_dir,
+            "reports": list(self.reports),
+        }
+
+    @asynccontextmanager
+    async def profile(self, chat_id: str, trace_id: str):
+        """Profile the enclosed turn if profiling is armed for it."""
+        if not self.remaining or self._active or (self.chat_id and chat_id != self.chat_id):
+            yield
+            return
+
+        from pyinstrument import Profiler
+
+        self.remaining -= 1
+        self._active = True
+        profiler = Profiler(interval=self.interval_ms / 1000, async_mode="enabled")
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            self._active = False
+            try:
+                report = await asyncio.to_thread(self._write, profiler, trace_id, chat_id)
+                self.reports.append(report)
+                logger.info("Profile of turn %s written to %s", trace_id, report["speedscope"])
+            except Exception as e:
+                logger.error("Error writing profile of turn %s: %s", trace_id, e)
+
+    def _write(self, profiler, trace_id: str, chat_id: str) -> Dict[str, Any]:
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{trace_id}")
+        with open(f"{base}.speedscope.json", "w") as f:
+            f.write(profiler.output(renderer=SpeedscopeRenderer()))
+        session = profiler.last_session
+        report = {
+            "trace_id": trace_id,
+            "chat_id": chat_id,
+            "duration_seconds": round(session.duration, 3),
+            "cpu_seconds": round(session.cpu_time, 3),
+            "speedscope": f"{base}.speedscope.json",
+            "summary": f"{base}.top.json",
+            "hot_functions": _hot_functions(session.root_frame()),
+        }
+        with open(f"{base}.top.json", "w") as f:
+            json.dump(report, f, indent=2)
+        return report
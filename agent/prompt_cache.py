@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from google import genai
+from google.genai import types
+
+from metrics import observe_tokens
+
+logger = logging.getLogger(__name__)
+
+# Explicit context caching of the static request prefix (system instruction + tool schemas)
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "false").lower() == "true"
+PROMPT_CACHE_TTL_SECONDS = int(os.getenv("PROMPT_CACHE_TTL_SECONDS", "3600"))
+# Recreate the cache this many seconds before it expires so requests never hit an expired cache
+PROMPT_CACHE_REFRESH_MARGIN_SECONDS = 60
+# After a failed cache creation (e.g. prefix below the model's minimum size), wait before retrying
+PROMPT_CACHE_RETRY_SECONDS = 300
+PROMPT_CACHE_MAX_ENTRIES = 32
+
+# Running totals of input tokens reported by the model, split by cache hit
+usage_totals = {
+    "model_calls": 0,
+    "input_tokens": 0,
+    "cached_input_tokens": 0,
+    "uncached_input_tokens": 0,
+    "output_tokens": 0,
+}
+
+
+def record_usage(usage_metadata) -> Dict[str, int]:
+    """
+    Add the token usage of one model response to the running totals.
+
+    Args:
+        usage_metadata: The usage metadata of a model response (may be None)
+
+    Returns:
+        Dict[str, int]: Input, cached input, uncached input and output tokens of this response
+    """
+    prompt_tokens = getattr(usage_metadata, "prompt_token_count", None) or 0
+    cached_tokens = getattr(usage_metadata, "cached_content_token_count", None) or 0
+    output_tokens = getattr(usage_metadata, "candidates_token_count", None) or 0
+    usage = {
+        "input_tokens": prompt_tokens,
+        "cached_input_tokens": cached_tokens,
+        "uncached_input_tokens": max(prompt_tokens - cached_tokens, 0),
+        "output_tokens": output_tokens,
+    }
+    usage_totals["model_calls"] += 1
+    for key, value in usage.items():
+        usage_totals[key] += value
+    return usage
+
+
+def _fingerprint(model: str, config: types.GenerateContentConfig) -> str:
+    """Hash the parts of a request that make up the cacheable prefix."""
+    digest = hashlib.sha256(model.encode())
+    if config.system_instruction is not None:
+        instruction = config.system_instruction
+        if isinstance(instruction, types.Content):
+            instruction = instruction.model_dump_json(exclude_none=True)
+        digest.update(str(instruction).encode())
+    for tool in config.tools or []:
+        if isinstance(tool, types.Tool):
+            digest.update(tool.model_dump_json(exclude_none=True).encode())
+        else:
+            digest.update(repr(tool).encode())
+    if config.tool_config is not None:
+        digest.update(config.tool_config.model_dump_json(exclude_none=True).encode())
+    return digest.hexdigest()
+
+
+class PromptCache:
+    """
+    Keeps the system instruction and tool schemas in a provider-side context cache.
+
+    Plugged into the agent as before/after model callbacks: before each model call the
+    static prefix is fingerprinted, a cache is created (or reused) for it, and the request
+    is rewritten to reference the cache instead of resending the prefix. A change to the
+    prompt file or to the tool set yields a new fingerprint and therefore a fresh cache.
+
+    The instruction is fingerprinted after ADK has filled in session state, so it must not
+    contain per-chat placeholders such as {user_id}: each chat would get its own cache.
+    Per-chat details go into the user's message instead (see call_agent_async).
+    """
+
+    def __init__(self, enabled: bool = PROMPT_CACHE_ENABLED, ttl_seconds: int = PROMPT_CACHE_TTL_SECONDS):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self._client: Optional[genai.Client] = None
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._failed_until: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+        # Deletions of evicted caches in flight, referenced so they are not garbage collected
+        self._deletions: Set[asyncio.Task] = set()
+
+    @property
+    def client(self) -> genai.Client:
+        if self._client is None:
+            self._client = genai.Client()
+        return self._client
+
+    async def _get_or_create(self, fingerprint: str, model: str, config: types.GenerateContentConfig) -> Optional[str]:
+        """Return the name of a live cache for the fingerprint, creating one if needed."""
+        now = time.time()
+        entry = self._entries.get(fingerprint)
+        if entry and entry[1] - PROMPT_CACHE_REFRESH_MARGIN_SECONDS > now:
+            self._entries.move_to_end(fingerprint)
+            return entry[0]
+        if self._failed_until.get(fingerprint, 0) > now:
+            return None
+        self._failed_until.pop(fingerprint, None)
+
+        async with self._lock:
+            # Another turn may have created the cache while we were waiting for the lock
+            entry = self._entries.get(fingerprint)
+            if entry and entry[1] - PROMPT_CACHE_REFRESH_MARGIN_SECONDS > time.time():
+                return entry[0]
+            try:
+                cache = await self.client.aio.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        display_name=f"butler-prefix-{fingerprint[:12]}",
+                        system_instruction=config.system_instruction,
+                        tools=config.tools,
+                        tool_config=config.tool_config,
+                        ttl=f"{self.ttl_seconds}s",
+                    ),
+                )
+            except Exception as e:
+                logger.warning("Prompt cache creation failed, sending uncached prefix: %s", e)
+                now = time.time()
+                # Prefixes that failed once and never came back would otherwise pile up
+                for expired in [key for key, until in self._failed_until.items() if until <= now]:
+                    del self._failed_until[expired]
+                self._failed_until[fingerprint] = now + PROMPT_CACHE_RETRY_SECONDS
+                return None
+
+            self._entries[fingerprint] = (cache.name, time.time() + self.ttl_seconds)
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > PROMPT_CACHE_MAX_ENTRIES:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._delete_in_background(evicted)
+            logger.info("Prompt cache created: %s (ttl %ds)", cache.name, self.ttl_seconds)
+            return cache.name
+
+    def _delete_in_background(self, cache_name: str) -> None:
+        """Delete an evicted cache on the server rather than paying for its storage until its TTL."""
+        task = asyncio.create_task(self._delete(cache_name))
+        self._deletions.add(task)
+        task.add_done_callback(self._deletions.discard)
+
+    async def _delete(self, cache_name: str) -> None:
+        try:
+            await self.client.aio.caches.delete(name=cache_name)
+            logger.info("Prompt cache deleted: %s", cache_name)
+        except Exception as e:
+            logger.warning("Prompt cache deletion failed, it expires with its TTL: %s", e)
+
+    async def before_model_callback(self, callback_context, llm_request):
+        """Rewrite the request to use the cached prefix. Never short-circuits the model call."""
+        if not self.enabled or llm_request.config is None:
+            return None
+        model = llm_request.model or ""
+        if not model.startswith("gemini"):
+            return None
+
+        config = llm_request.config
+        if config.cached_content:
+            return None
+        fingerprint = _fingerprint(model, config)
+        cache_name = await self._get_or_create(fingerprint, model, config)
+        if cache_name:
+            # The API rejects requests that repeat cached fields alongside cached_content
+            config.cached_content = cache_name
+            config.system_instruction = None
+            config.tools = None
+            config.tool_config = None
+        return None
+
+    async def after_model_callback(self, callback_context, llm_response):
+        """Record cached and uncached input tokens of the response."""
+        usage_metadata = getattr(llm_response, "usage_metadata", None)
+        # Partial streaming chunks repeat the usage of the call they belong to
+        if usage_metadata is None or getattr(llm_response, "partial", False):
+            return None
+        usage = record_usage(usage_metadata)
+        observe_tokens(usage)
+        logger.info(
+            "  [Tokens] input: %d (cached: %d, uncached: %d), output: %d",
+            usage["input_tokens"], usage["cached_input_tokens"], usage["uncached_input_tokens"], usage["output_tokens"],
+        )
+        return None
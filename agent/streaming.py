@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Send long answers to WhatsApp piece by piece while the model is still generating
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "false").lower() == "true"
+# A chunk is only sent once it holds at least this many characters of complete sentences
+STREAM_MIN_CHUNK_CHARS = int(os.getenv("STREAM_MIN_CHUNK_CHARS", "300"))
+# Minimum spacing between two WhatsApp sends of the same turn, to respect rate limits
+STREAM_MIN_INTERVAL_SECONDS = float(os.getenv("STREAM_MIN_INTERVAL_SECONDS", "2"))
+# Optional "working on it" message sent when nothing has been streamed after this delay (0 disables)
+STREAM_ACK_AFTER_SECONDS = float(os.getenv("STREAM_ACK_AFTER_SECONDS", "5"))
+STREAM_ACK_MESSAGE = os.getenv("STREAM_ACK_MESSAGE", "⏳ Working on it...")
+
+# Paragraph breaks are preferred over sentence ends as chunk boundaries
+_PARAGRAPH_END = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"[.!?:](?=\s)|\n")
+
+
+def _last_boundary(text: str) -> int:
+    """Return the index right after the last paragraph or sentence end in text, or 0."""
+    paragraphs = [m.end() for m in _PARAGRAPH_END.finditer(text)]
+    if paragraphs:
+        return paragraphs[-1]
+    sentences = [m.end() for m in _SENTENCE_END.finditer(text)]
+    return sentences[-1] if sentences else 0
+
+
+class ResponseStreamer:
+    """
+    Turns partial model output into WhatsApp messages made of complete sentences or paragraphs.
+
+    Partial text is buffered and flushed up to its last sentence boundary once the chunk is
+    long enough and the previous send is far enough in the past. Whatever has not been
+    streamed when the final response arrives is returned by remainder() for the caller to send,
+    once wait_for_final_send() allows it.
+
+    Sends are serialized, so the "working on it" message either goes out before the first
+    chunk or not at all.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        min_chunk_chars: int = STREAM_MIN_CHUNK_CHARS,
+        min_interval_seconds: float = STREAM_MIN_INTERVAL_SECONDS,
+        ack_after_seconds: float = STREAM_ACK_AFTER_SECONDS,
+        ack_message: str = STREAM_ACK_MESSAGE,
+    ):
+        self.send = send
+        self.min_chunk_chars = min_chunk_chars
+        self.min_interval_seconds = min_interval_seconds
+        self.ack_after_seconds = ack_after_seconds
+        self.ack_message = ack_message
+        self.buffer = ""
+        self.streamed = ""
+        self.chunks_sent = 0
+        self._last_sent_at = 0.0
+        self._ack_task: Optional[asyncio.Task] = None
+        self._ack_sending = False
+        self._send_lock = asyncio.Lock()
+
+    def start(self) -> None:
+        """Arm the "working on it" message for turns that take a while to produce output."""
+        if self.ack_after_seconds > 0 and self.ack_message:
+            self._ack_task = asyncio.create_task(self._send_ack())
+
+    async def _send_ack(self) -> None:
+        await asyncio.sleep(self.ack_after_seconds)
+        async with self._send_lock:
+            if self.chunks_sent == 0:
+                self._ack_sending = True
+                await self._send(self.ack_message)
+
+    async def _send(self, text: str) -> None:
+        self._last_sent_at = time.monotonic()
+        try:
+            await self.send(text)
+        except Exception as e:
+            logger.error("Error streaming chunk to WhatsApp: %s", e)
+
+    async def feed(self, text: str) -> None:
+        """Add a partial text chunk and send the complete part of the buffer if it is due."""
+        self.buffer += text
+        if time.monotonic() - self._last_sent_at < self.min_interval_seconds:
+            return
+        cut = _last_boundary(self.buffer)
+        if cut < self.min_chunk_chars:
+            return
+        chunk, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        self.streamed += chunk
+        # From here on a pending ack is skipped; one already being sent goes out first
+        self.chunks_sent += 1
+        async with self._send_lock:
+            await self._send(chunk.strip())
+
+    def reset(self) -> None:
+        """Drop unsent partial text, e.g. a preamble the model emitted before a tool call."""
+        self.buffer = ""
+
+    def remainder(self, final_text: str) -> str:
+        """
+        Return the part of the final response that has not been streamed yet.
+
+        Args:
+            final_text (str): The complete final response text
+
+        Returns:
+            str: The text still to send (empty if everything was streamed)
+        """
+        if self.streamed and final_text.startswith(self.streamed):
+            return final_text[len(self.streamed):].strip()
+        return final_text
+
+    async def wait_for_final_send(self) -> None:
+        """
+        Wait until the final message may be sent: after the ack or chunk being sent, if any,
+        and at least min_interval_seconds after the last send.
+        """
+        async with self._send_lock:
+            if self._last_sent_at:
+                delay = self._last_sent_at + self.min_interval_seconds - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+    def close(self) -> None:
+        """Cancel the pending "working on it" message, unless it is already being sent."""
+        if self._ack_task and not self._ack_sending:
+            self._ack_task.cancel()
@@ -2,15 +2,16 @@ import os
 import base64
 from typing import Optional, Dict, Any
 from google.adk.tools import ToolContext
-import google.generativeai as genai
-from dotenv import load_dotenv
+from metrics import stage
+from deadline import MEDIA_MODEL_TIMEOUT_SECONDS, stage_timeout
+from tools.media_model import get_media_model
+from hedging import HedgePolicy, hedged_call
+from media_store import media_store
 
-load_dotenv()
+# Latency history and hedge budget of this tool's Gemini calls
+_hedging = HedgePolicy("audio_model")
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
-def transcribe_audio(tool_context: ToolContext, file_path: str, prompt: str = "Transcribe this audio file") -> Dict[str, Any]:
+async def transcribe_audio(tool_context: ToolContext, file_path: str, prompt: str = "Transcribe this audio file") -> Dict[str, Any]:
     """
     Transcribe an audio file using Google's Gemini model.
     
@@ -22,8 +23,8 @@ def transcribe_audio(tool_context: ToolContext, file_path: str, prompt: str = "T
         dict: Transcription results
     """
     try:
-        # Check if file exists
-        if not os.path.exists(file_path):
+        # Check if file exists (and mark it in use, so the media store does not evict it meanwhile)
+        if not media_store.describe(file_path)["exists"]:
             return {
                 "success": False,
                 "error": "Audio file not found",
@@ -46,7 +47,7 @@ def transcribe_audio(tool_context: ToolContext, file_path: str, prompt: str = "T
             audio_data = audio_file.read()
             
         # Create the model
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        model = get_media_model()
         
         # Prepare the audio for the model
         mime_type_map = {
@@ -66,7 +67,11 @@ def transcribe_audio(tool_context: ToolContext, file_path: str, prompt: str = "T
         }
         
         # Generate content
-        response = model.generate_content([prompt, audio_part])
+        with stage("media_model"):
+            response = await hedged_call(lambda: model.generate_content(
+                [prompt, audio_part],
+                request_options={"timeout": stage_timeout(MEDIA_MODEL_TIMEOUT_SECONDS)},
+            ), _hedging)
         
         return {
             "success": True,
@@ -83,7 +88,7 @@ def transcribe_audio(tool_context: ToolContext, file_path: str, prompt: str = "T
             "file_path": file_path
         }
 
-def analyze_audio_content(tool_context: ToolContext, file_path: str) -> Dict[str, Any]:
+async def analyze_audio_content(tool_context: ToolContext, file_path: str) -> Dict[str, Any]:
     """
     Analyze audio content including transcription and context understanding.
     
@@ -93,13 +98,13 @@ def analyze_audio_content(tool_context: ToolContext, file_path: str) -> Dict[str
     Returns:
         dict: Analysis results including transcription and content analysis
     """
-    return transcribe_audio(
+    return await transcribe_audio(
         tool_context,
         file_path, 
         "Transcribe this audio and provide a summary of the main topics discussed, tone, and any important information."
     )
 
-def extract_speech_from_audio(tool_context: ToolContext, file_path: str) -> Dict[str, Any]:
+async def extract_speech_from_audio(tool_context: ToolContext, file_path: str) -> Dict[str, Any]:
     """
     Extract and transcribe speech from an audio file.
     
@@ -109,7 +114,7 @@ def extract_speech_from_audio(tool_context: ToolContext, file_path: str) -> Dict
     Returns:
         dict: Speech transcription results
     """
-    return transcribe_audio(
+    return await transcribe_audio(
         tool_context,
         file_path,
         "Transcribe all speech in this audio file. If multiple speakers, try to identify them. If no speech is detected, say 'No speech detected'."
@@ -7,6 +7,7 @@ import logging
 from urllib.parse import urlparse
 from typing import Optional, Dict, Any, List
 from google.adk.tools import ToolContext
+from admission import REMINDER_FIELD, REMINDER_SENDER
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -76,13 +77,18 @@ def schedule_task(cron_expression: str, message: str, tool_context: ToolContext)
             }
         # Create the JSON payload with the new structure
         json_payload = json.dumps({
-            "name": "My past self",
+            "name": REMINDER_SENDER,
             "from": user_id,
-            "message": f"{QUERY_PREFIX}{message}"
+            "message": f"{QUERY_PREFIX}{message}",
+            REMINDER_FIELD: True
         })
+        # The shell adds the firing time, so the webhook's dedup tells every firing apart
+        # (python-crontab escapes the % for cron)
+        payload_head = json_payload[:-1] + ', "timestamp": '
+        payload_arg = shlex.quote(payload_head) + "$(date +%s)" + shlex.quote("}")
 
         # Construct the curl command
-        command = f"curl -X POST -H {shlex.quote('Content-Type: application/json')} -d {shlex.quote(json_payload)} {shlex.quote(WEBHOOK_URL)}"
+        command = f"curl -X POST -H {shlex.quote('Content-Type: application/json')} -d {payload_arg} {shlex.quote(WEBHOOK_URL)}"
 
         cron = CronTab(user=True)
         job = cron.new(command=command, comment=f"{COMMENT_PREFIX}{message}")
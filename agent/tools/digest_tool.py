@@ -0,0 +1,37 @@
+from typing import Dict, Any
+from google.adk.tools import ToolContext
+from deadline import time_left
+from digest import digest_engine
+
+async def digest_chats(tool_context: ToolContext, since_hours: float = 24.0, groups_only: bool = True, chat_filter: str = "", focus: str = "") -> Dict[str, Any]:
+    """
+    Summarise many chats at once, e.g. "summarise all my groups from today" or a scheduled daily digest.
+
+    Every active chat is read and summarised in parallel, and only messages not covered by an
+    earlier digest are summarised again, so this is much faster than reading the chats one by one.
+
+    Args:
+        since_hours (float): How far back to look, in hours (e.g. 24 for a daily digest)
+        groups_only (bool): Only cover group chats (default: True)
+        chat_filter (str): Only cover chats whose name contains this text, e.g. "family" (default: all chats)
+        focus (str): What the digest should concentrate on, e.g. "deadlines" (default: everything notable)
+
+    Returns:
+        dict: The digest text, the number of chats and new messages it covered, and any chats that failed
+    """
+    try:
+        return await digest_engine.digest(since_hours=since_hours, groups_only=groups_only, chat_filter=chat_filter, focus=focus)
+    except TimeoutError:
+        left = time_left()
+        if left is not None and left <= 0:
+            # The turn's deadline passed: let the turn be cancelled
+            raise
+        return {
+            "success": False,
+            "error": "The digest did not finish in time"
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"Error building digest: {str(e)}"
+        }
@@ -2,15 +2,16 @@ import os
 import base64
 from typing import Optional, Dict, Any
 from google.adk.tools import ToolContext
-import google.generativeai as genai
-from dotenv import load_dotenv
+from metrics import stage
+from deadline import MEDIA_MODEL_TIMEOUT_SECONDS, stage_timeout
+from tools.media_model import get_media_model
+from hedging import HedgePolicy, hedged_call
+from media_store import media_store
 
-load_dotenv()
+# Latency history and hedge budget of this tool's Gemini calls
+_hedging = HedgePolicy("image_model")
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
-def analyze_image(tool_context: ToolContext, file_path: str, prompt: str = "Describe this image in detail") -> Dict[str, Any]:
+async def analyze_image(tool_context: ToolContext, file_path: str, prompt: str = "Describe this image in detail") -> Dict[str, Any]:
     """
     Analyze an image file using Google's Gemini Vision model.
     
@@ -22,8 +23,8 @@ def analyze_image(tool_context: ToolContext, file_path: str, prompt: str = "Desc
         dict: Analysis results including description and any detected elements
     """
     try:
-        # Check if file exists
-        if not os.path.exists(file_path):
+        # Check if file exists (and mark it in use, so the media store does not evict it meanwhile)
+        if not media_store.describe(file_path)["exists"]:
             return {
                 "success": False,
                 "error": "Image file not found",
@@ -45,7 +46,7 @@ def analyze_image(tool_context: ToolContext, file_path: str, prompt: str = "Desc
             image_data = image_file.read()
             
         # Create the model
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        model = get_media_model()
         
         # Prepare the image for the model
         image_part = {
@@ -54,7 +55,11 @@ def analyze_image(tool_context: ToolContext, file_path: str, prompt: str = "Desc
         }
         
         # Generate content
-        response = model.generate_content([prompt, image_part])
+        with stage("media_model"):
+            response = await hedged_call(lambda: model.generate_content(
+                [prompt, image_part],
+                request_options={"timeout": stage_timeout(MEDIA_MODEL_TIMEOUT_SECONDS)},
+            ), _hedging)
         
         return {
             "success": True,
@@ -71,7 +76,7 @@ def analyze_image(tool_context: ToolContext, file_path: str, prompt: str = "Desc
             "file_path": file_path
         }
 
-def extract_text_from_image(tool_context: ToolContext, file_path: str) -> Dict[str, Any]:
+async def extract_text_from_image(tool_context: ToolContext, file_path: str) -> Dict[str, Any]:
     """
     Extract text from an image using OCR capabilities of Gemini Vision.
     
@@ -81,13 +86,13 @@ def extract_text_from_image(tool_context: ToolContext, file_path: str) -> Dict[s
     Returns:
         dict: Extracted text and OCR results
     """
-    return analyze_image(
+    return await analyze_image(
         tool_context,
         file_path, 
         "Extract all text visible in this image. If no text is found, say 'No text detected'."
     )
 
-def identify_objects_in_image(tool_context: ToolContext, file_path: str) -> Dict[str, Any]:
+async def identify_objects_in_image(tool_context: ToolContext, file_path: str) -> Dict[str, Any]:
     """
     Identify and list objects, people, or elements in an image.
     
@@ -97,7 +102,7 @@ def identify_objects_in_image(tool_context: ToolContext, file_path: str) -> Dict
     Returns:
         dict: List of identified objects and elements
     """
-    return analyze_image(
+    return await analyze_image(
         tool_context,
         file_path,
         "List and describe all objects, people, animals, or notable elements you can identify in this image. Be specific and detailed."
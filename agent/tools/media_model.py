@@ -0,0 +1,28 @@
+import os
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MEDIA_MODEL = "gemini-2.0-flash"
+
+
+@lru_cache(maxsize=None)
+def get_media_model(model_name: str = MEDIA_MODEL):
+    """
+    Get the Gemini model used by the media analysis tools.
+
+    google.generativeai is imported and configured on first use instead of when the
+    tools are imported, which keeps it off the server's startup path.
+
+    Args:
+        model_name (str): The Gemini model name
+
+    Returns:
+        genai.GenerativeModel: The model, shared by all calls
+    """
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    return genai.GenerativeModel(model_name)
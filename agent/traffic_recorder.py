@@ -0,0 +1,138 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import re
+import threading
+from typing import Any, Dict, Optional
+
+from admission import is_reminder
+
+logger = logging.getLogger(__name__)
+
+# Opt-in recording of anonymised /webhook traffic for replay (see bench/replay.py)
+TRAFFIC_RECORD_PATH = os.getenv("TRAFFIC_RECORD_PATH", "")
+# Secret keying the pseudonyms of chat and message ids; derived from WHATSAPP_API_KEY if unset.
+# Every worker and every restart must use the same one, or a chat's pseudonym changes.
+TRAFFIC_RECORD_SALT = os.getenv("TRAFFIC_RECORD_SALT", "")
+WHATSAPP_API_KEY = os.getenv("WHATSAPP_API_KEY", "")
+QUERY_PREFIX = os.getenv("QUERY_PREFIX", "🤖 *butler:*")
+
+_WORD_CHAR = re.compile(r"\w", re.UNICODE)
+
+
+def anonymise_text(text: str, keep_prefix: str = QUERY_PREFIX) -> str:
+    """
+    Replace every letter and digit with "x", keeping length, spacing and punctuation.
+    The shape that matters for performance (size, sentence ends, line breaks) survives,
+    and so does the butler prefix, which decides whether a message is processed at all.
+    """
+    text = text or ""
+    if keep_prefix and text.startswith(keep_prefix):
+        return keep_prefix + _WORD_CHAR.sub("x", text[len(keep_prefix):])
+    return _WORD_CHAR.sub("x", text)
+
+
+class TrafficRecorder:
+    """
+    Appends one compact JSON line per webhook delivery.
+
+    Keys: t (arrival, epoch seconds), c (pseudonymised chat), m (pseudonymised message id,
+    if the delivery has one), x (anonymised text), g (group chat), r (reminder),
+    md (media: type, mimetype, size), s (HTTP status), l (handling latency in ms).
+
+    Lines are written by a background thread, so the event loop never waits on the disk.
+    Recording stays off without a configured secret to key the pseudonyms.
+    """
+
+    def __init__(self, path: str = TRAFFIC_RECORD_PATH, salt: str = TRAFFIC_RECORD_SALT,
+                 fallback_secret: str = WHATSAPP_API_KEY):
+        if salt:
+            self._key = salt.encode()
+        elif fallback_secret:
+            self._key = hmac.new(fallback_secret.encode(), b"traffic-record-salt", hashlib.sha256).digest()
+        else:
+            self._key = b""
+            if path:
+                logger.warning("Traffic recording disabled: set TRAFFIC_RECORD_SALT (or WHATSAPP_API_KEY) "
+                               "to key the pseudonyms")
+        self.path = path if self._key else ""
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _pseudonym(self, value: Any) -> str:
+        return hmac.new(self._key, str(value).encode(), hashlib.sha256).hexdigest()[:12]
+
+    def record(self, message: Dict[str, Any], arrived_at: float, status: int, latency_seconds: float) -> None:
+        """
+        Append an anonymised record of one delivery. Never raises.
+
+        Args:
+            message (Dict[str, Any]): The webhook payload
+            arrived_at (float): Arrival time (epoch seconds)
+            status (int): HTTP status returned for the delivery
+            latency_seconds (float): Time spent handling the delivery
+        """
+        if not self.enabled:
+            return
+        try:
+            entry: Dict[str, Any] = {
+                "t": round(arrived_at, 3),
+                "c": self._pseudonym(message.get("from", "")),
+                "x": anonymise_text(message.get("message", "")),
+                "s": status,
+                "l": round(latency_seconds * 1000, 1),
+            }
+            if message.get("messageId"):
+                entry["m"] = self._pseudonym(message["messageId"])
+            if is_reminder(message):
+                entry["r"] = 1
+            if message.get("isGroup"):
+                entry["g"] = 1
+            if message.get("hasMedia"):
+                media_info: Optional[Dict[str, Any]] = message.get("mediaInfo") or {}
+                entry["md"] = [message.get("mediaType"), media_info.get("mimetype"), media_info.get("filesize", 0)]
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_lines, name="traffic-recorder", daemon=True)
+                self._writer.start()
+            self._queue.put(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        except Exception as e:
+            logger.warning("Traffic recording failed: %s", e)
+
+    def _write_lines(self) -> None:
+        """Append queued lines to the file until close() queues None."""
+        try:
+            file = open(self.path, "a", encoding="utf-8")
+        except OSError as e:
+            logger.warning("Traffic recording disabled, cannot open %s: %s", self.path, e)
+            self.path = ""
+            return
+        with file:
+            while True:
+                line = self._queue.get()
+                if line is None:
+                    return
+                try:
+                    file.write(line)
+                    # Write out whatever else is pending before flushing
+                    while not self._queue.empty():
+                        line = self._queue.get_nowait()
+                        if line is None:
+                            return
+                        file.write(line)
+                    file.flush()
+                except Exception as e:
+                    logger.warning("Traffic recording failed: %s", e)
+
+    def close(self) -> None:
+        """Write out the pending lines and stop the writer thread."""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join(timeout=10)
+            self._writer = None
@@ -1,18 +1,37 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse, HTMLResponse, Response
 import asyncio
+import importlib
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List
 import os
-from agent import call_agent_async, initialize_agent_and_runner
+from dedup import WebhookDeduplicator, delivery_key
+from coalescer import ChatCoalescer
+from traffic_recorder import TrafficRecorder
+from media_store import media_store
+from profiling import PROFILING_ADMIN_TOKEN, ProfilingRateLimited, TurnProfiler
+import worker_pool
+from worker_pool import WEBHOOK_WORKERS
+import hmac
+from streaming import STREAM_RESPONSES, ResponseStreamer
+from deadline import (
+    TURN_TIMEOUT_SECONDS, WHATSAPP_SEND_TIMEOUT_SECONDS, DEADLINE_MESSAGE,
+    DeadlineExceeded, stage_timeout, turn_deadline,
+)
+from admission import (
+    AdmissionController, ModelCallFailed, Overloaded, BUSY_MESSAGE,
+    PRIORITY_COMMAND, PRIORITY_REMINDER, PRIORITY_MEDIA_CONTEXT, is_reminder,
+)
 from contextlib import asynccontextmanager
 import httpx
+import time
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import metrics
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from log_config import configure_logging, preview
+
+# Configure logging (LOG_LEVEL, LOG_FORMAT)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Get message prefix from environment variable or use default
@@ -20,18 +39,76 @@ QUERY_PREFIX = os.getenv("QUERY_PREFIX", "🤖 *butler:*")
 WHATSAPP_API_URL = os.getenv("WHATSAPP_API_URL")
 WHATSAPP_QR_URL = os.getenv("WHATSAPP_QR_URL")
 WHATSAPP_API_KEY = os.getenv("WHATSAPP_API_KEY")
+# Longest a turn waits for the agent to finish initializing
+STARTUP_WAIT_SECONDS = float(os.getenv("STARTUP_WAIT_SECONDS", "60"))
+
+async def initialize_agent(app: FastAPI):
+    """
+    Build the agent and runner, and warm up the media model at the same time.
+
+    Runs in the background so the server listens (and answers /health) right away;
+    /health/ready turns ready once the runner exists. google.adk and
+    google.generativeai take seconds to import, so both imports run in threads
+    and the event loop stays responsive meanwhile.
+    """
+    started = time.perf_counter()
+
+    async def build_runner():
+        agent_module = await asyncio.to_thread(importlib.import_module, "agent")
+        return await agent_module.initialize_agent_and_runner(model=getattr(app.state, "agent_model", None))
+
+    async def warm_media_model():
+        media_model = await asyncio.to_thread(importlib.import_module, "tools.media_model")
+        await asyncio.to_thread(media_model.get_media_model)
+
+    def log_warmup_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.warning("Media model warm-up failed: %s", task.exception())
+
+    # Started first so it overlaps the runner build; not awaited, as readiness does not
+    # need it, only the first media turn
+    app.state.media_warmup = asyncio.create_task(warm_media_model())
+    app.state.media_warmup.add_done_callback(log_warmup_failure)
+    app.state.runner, app.state.agent = await build_runner()
+    app.state.startup_seconds = round(time.perf_counter() - started, 3)
+    logger.info("Agent and runner initialized in %.2fs and stored in app.state.", app.state.startup_seconds)
+
+async def agent_runner():
+    """
+    The runner, waiting for initialization to finish if needed
+
+    Raises:
+        RuntimeError: If the agent is not ready within STARTUP_WAIT_SECONDS
+    """
+    if not app.state.init_task.done():
+        try:
+            await asyncio.wait_for(asyncio.shield(app.state.init_task), STARTUP_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Agent not initialized after {STARTUP_WAIT_SECONDS:.0f}s")
+    app.state.init_task.result()
+    return app.state.runner
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    runner, agent  = await initialize_agent_and_runner()
-    app.state.runner = runner
-    app.state.agent = agent
-    logger.info("Agent and runner initialized and stored in app.state.")
+    app.state.init_task = asyncio.create_task(initialize_agent(app))
+    media_store.start()
     yield
+    app.state.init_task.cancel()
+    media_store.close()
+    if hasattr(app.state, "agent"):
+        from agent import mcp_toolsets
+        for toolset in mcp_toolsets(app.state.agent):
+            await toolset.close()
+    traffic_recorder.close()
     logger.info("Agent and runner resources closed.")
 
 app = FastAPI(title="WhatsApp Butler Webhook", lifespan=lifespan)
 app.state.is_connected = False
+webhook_deduplicator = WebhookDeduplicator()
+admission_controller = AdmissionController()
+traffic_recorder = TrafficRecorder()
+turn_profiler = TurnProfiler()
+
 async def send_message_to_whatsapp(response: str, chat_id: str):
     """
     Send a message to WhatsApp
@@ -40,101 +117,218 @@ async def send_message_to_whatsapp(response: str, chat_id: str):
         chat_id (str): The chat ID of the message
     """
     # Send the message to the WHATSAPP_API_URL
-    async with httpx.AsyncClient() as client:
-        await client.post(f"{WHATSAPP_API_URL}/send",
-                          headers={"Authorization": f"Bearer {WHATSAPP_API_KEY}"},
-                          json={"message": response, "number": chat_id})
-    logger.info(f"Message sent to WhatsApp: {response} to {chat_id}")
+    with metrics.stage("whatsapp_send"):
+        async with httpx.AsyncClient(timeout=stage_timeout(WHATSAPP_SEND_TIMEOUT_SECONDS)) as client:
+            await client.post(f"{WHATSAPP_API_URL}/send",
+                              headers={"Authorization": f"Bearer {WHATSAPP_API_KEY}"},
+                              json={"message": response, "number": chat_id})
+    logger.info("Message sent to WhatsApp to %s: %s", chat_id, preview(response))
 
-async def process_message(message: Dict[str, Any]) -> Dict[str, Any]:
+def describe_message(message: Dict[str, Any]) -> str:
     """
-    Process incoming WhatsApp message and call agent
+    Build the text the agent sees for a message, including attached media
 
     Args:
         message (Dict[str, Any]): The incoming message data
 
     Returns:
-        Dict[str, Any]: Response containing status and agent response
+        str: The message text with media annotations
     """
-    try:
-        # Extract message content
-        content = message.get("message", "")
-        sender = message.get("name", "")
-        chat_id = message.get("from", "")
-        has_media = message.get("hasMedia", False)
-        media_type = message.get("mediaType", None)
-        media_info = message.get("mediaInfo", None)
-
-        # If there's no text content but there's media, inform about the media
-        if not content and has_media:
-            if media_info:
-                if media_type == 'audio':
-                    content = f"[Audio received: {media_info.get('filename', 'unknown')}]"
-                elif media_type == 'image':
-                    content = f"[Image received: {media_info.get('filename', 'unknown')}]"
-                else:
-                    content = f"[Media downloaded: {media_type} - {media_info.get('filename', 'unknown')}]"
+    content = message.get("message", "")
+    has_media = message.get("hasMedia", False)
+    media_type = message.get("mediaType", None)
+    media_info = message.get("mediaInfo", None)
+
+    # If there's no text content but there's media, inform about the media
+    if not content and has_media:
+        if media_info:
+            if media_type == 'audio':
+                content = f"[Audio received: {media_info.get('filename', 'unknown')}]"
+            elif media_type == 'image':
+                content = f"[Image received: {media_info.get('filename', 'unknown')}]"
+            else:
+                content = f"[Media downloaded: {media_type} - {media_info.get('filename', 'unknown')}]"
+        else:
+            if media_type == 'audio':
+                content = "[Audio received]"
+            elif media_type == 'image':
+                content = "[Image received]"
+            else:
+                content = f"[Media: {media_type}]"
+    elif content and has_media:
+        if media_info:
+            if media_type == 'audio':
+                content = f"{content} [Audio attached: {media_info.get('filename', 'unknown')}]"
+            elif media_type == 'image':
+                content = f"{content} [Image attached: {media_info.get('filename', 'unknown')}]"
             else:
-                if media_type == 'audio':
-                    content = "[Audio received]"
-                elif media_type == 'image':
-                    content = "[Image received]"
-                else:
-                    content = f"[Media: {media_type}]"
-        elif content and has_media:
-            if media_info:
-                if media_type == 'audio':
-                    content = f"{content} [Audio attached: {media_info.get('filename', 'unknown')}]"
-                elif media_type == 'image':
-                    content = f"{content} [Image attached: {media_info.get('filename', 'unknown')}]"
-                else:
-                    content = f"{content} [Media attached: {media_type} - {media_info.get('filename', 'unknown')}]"
+                content = f"{content} [Media attached: {media_type} - {media_info.get('filename', 'unknown')}]"
+        else:
+            if media_type == 'audio':
+                content = f"{content} [Audio attached]"
+            elif media_type == 'image':
+                content = f"{content} [Image attached]"
             else:
-                if media_type == 'audio':
-                    content = f"{content} [Audio attached]"
-                elif media_type == 'image':
-                    content = f"{content} [Image attached]"
-                else:
-                    content = f"{content} [Media attached: {media_type}]"
+                content = f"{content} [Media attached: {media_type}]"
+    return content
 
-        if not content:
+def turn_priority(messages: List[Dict[str, Any]], has_query: bool) -> int:
+    """
+    Admission priority of a turn: direct commands first, scheduled reminders next, media context last
+
+    Args:
+        messages (List[Dict[str, Any]]): The messages of the burst
+        has_query (bool): Whether the burst contains a text query for the agent
+
+    Returns:
+        int: One of the admission PRIORITY_* constants
+    """
+    if not has_query:
+        return PRIORITY_MEDIA_CONTEXT
+    if all(is_reminder(m) for m in messages):
+        return PRIORITY_REMINDER
+    return PRIORITY_COMMAND
+
+async def process_burst(chat_id: str, messages: List[Dict[str, Any]]) -> JSONResponse:
+    """
+    Run one agent turn for a burst of messages coalesced from the same chat
+
+    Args:
+        chat_id (str): The chat ID of the messages
+        messages (List[Dict[str, Any]]): The messages of the burst, in arrival order
+
+    Returns:
+        JSONResponse: Response containing status
+    """
+    sender = messages[-1].get("name", "")
+    media_infos = [m["mediaInfo"] for m in messages if m.get("hasMedia") and m.get("mediaInfo")]
+    has_query = any(not (m.get("hasMedia") and m.get("mediaInfo")) for m in messages)
+    content = "\n".join(m["content"] for m in messages)
+    media_info = media_infos if len(media_infos) > 1 else (media_infos[0] if media_infos else None)
+    priority = turn_priority(messages, has_query)
+    kind = {PRIORITY_COMMAND: "command", PRIORITY_REMINDER: "reminder"}.get(priority, "media_context")
+    if len(messages) == 1 and messages[0].get("traceId"):
+        # The turn of a single delivery keeps the trace id its webhook request was logged with
+        trace_id = messages[0]["traceId"]
+        metrics.trace_id_var.set(trace_id)
+    else:
+        trace_id = metrics.new_trace_id()
+        logger.info("Turn %s covers messages %s (webhook traces %s)", trace_id,
+                    [m.get("messageId") for m in messages], [m.get("traceId") for m in messages])
+    started = time.perf_counter()
+    outcome = "error"
+
+    # Profiled here, inside the coalesced turn task, so the samples cover this chat's turn
+    # whichever delivery's handler or timer started it
+    async with turn_profiler.profile(chat_id, trace_id):
+        try:
+            runner = await agent_runner()
+            from agent import call_agent_async, format_reply
+            # Cancels the turn, queue wait included, once TURN_TIMEOUT_SECONDS have passed
+            async with turn_deadline(TURN_TIMEOUT_SECONDS):
+                async with admission_controller.admit(priority, uses_model=has_query):
+                    # Process media files to store context, even without query prefix
+                    if not has_query:
+                        logger.info("Storing media context for %s in chat %s", sender, chat_id)
+                        # Store media context by calling agent silently (no response sent)
+                        await call_agent_async(f"[MEDIA_CONTEXT_ONLY] {content}", runner, chat_id, chat_id, media_info)
+                        outcome = "success"
+                        # Don't send response to WhatsApp for context-only storage
+                        return JSONResponse(
+                            status_code=200,
+                            content={"status": "success"}
+                        )
+
+                    logger.info("Processing message from %s in chat %s", sender, chat_id)
+                    streamer = None
+                    if STREAM_RESPONSES:
+                        streamer = ResponseStreamer(lambda chunk: send_message_to_whatsapp(format_reply(chunk), chat_id))
+                        streamer.start()
+                    try:
+                        response = await call_agent_async(content, runner, chat_id, chat_id, media_info, streamer=streamer)
+                    except ModelCallFailed:
+                        # Only the model backend's own failures feed the circuit breaker
+                        admission_controller.record_model_error()
+                        raise
+                    finally:
+                        if streamer:
+                            streamer.close()
+                    admission_controller.record_model_success()
+
+            logger.info("Agent response: %s", preview(response))
+            if response:
+                if streamer:
+                    await streamer.wait_for_final_send()
+                await send_message_to_whatsapp(response, chat_id)
+            outcome = "success"
             return JSONResponse(
                 status_code=200,
                 content={"status": "success"}
             )
+        except asyncio.CancelledError:
+            # Shutdown or a cancelled burst: not a failure of the turn, and never answered
+            outcome = "cancelled"
+            raise
+        except DeadlineExceeded:
+            outcome = "timeout"
+            logger.warning("Turn %s for chat %s ran out of time after %.0fs and was cancelled", trace_id, chat_id, TURN_TIMEOUT_SECONDS)
+            if has_query:
+                await send_message_to_whatsapp(format_reply(DEADLINE_MESSAGE), chat_id)
+            return JSONResponse(
+                status_code=200,
+                content={"status": "timeout"}
+            )
+        except Overloaded as e:
+            outcome = "shed"
+            logger.warning("Turn %s for chat %s rejected: %s", trace_id, chat_id, e)
+            # Nobody is waiting for an answer to a media upload or to a reminder they did not type
+            if priority == PRIORITY_COMMAND:
+                await send_message_to_whatsapp(format_reply(BUSY_MESSAGE), chat_id)
+            return JSONResponse(
+                status_code=503,
+                content={"status": "busy", "error": str(e)}
+            )
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.TURN_LATENCY.labels(kind=kind, outcome=outcome).observe(elapsed)
+            logger.info("Turn %s (%s) finished in %.0f ms: %s", trace_id, kind, elapsed * 1000, outcome)
 
-        # Ignore messages generated by the butler itself (to prevent loops)
-        if content.startswith(QUERY_PREFIX):
+message_coalescer = ChatCoalescer(process_burst)
+
+async def process_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Process incoming WhatsApp message and call agent
+
+    Messages arriving in quick succession from the same chat are coalesced
+    into a single agent turn (see COALESCE_WINDOW_MS).
+
+    Args:
+        message (Dict[str, Any]): The incoming message data
+
+    Returns:
+        Dict[str, Any]: Response containing status and agent response
+    """
+    try:
+        chat_id = message.get("from", "")
+        content = describe_message(message)
+
+        if not content:
             return JSONResponse(
                 status_code=200,
                 content={"status": "success"}
             )
 
-        # Process media files to store context, even without query prefix
-        if has_media and media_info:
-            logger.info(f"Storing media context for {sender} in chat {chat_id}")
-            # Store media context by calling agent silently (no response sent)
-            runner = app.state.runner
-            response = await call_agent_async(f"[MEDIA_CONTEXT_ONLY] {content}", runner, chat_id, chat_id, media_info)
-            # Don't send response to WhatsApp for context-only storage
+        # Ignore messages generated by the butler itself (to prevent loops), except the
+        # scheduled reminders cron posts with the same prefix and the reminder marker
+        if content.startswith(QUERY_PREFIX) and not is_reminder(message):
             return JSONResponse(
                 status_code=200,
                 content={"status": "success"}
             )
 
-        logger.info(f"Processing message from {sender} in chat {chat_id}")
-
-        # Use runner from app.state
-        runner = app.state.runner
-        response = await call_agent_async(content, runner, chat_id, chat_id, media_info)
-        logger.info(f"Agent response: {response}")
-        await send_message_to_whatsapp(response, chat_id)
-        return JSONResponse(
-            status_code=200,
-            content={"status": "success"}
-        )
+        return await message_coalescer.submit(chat_id, {**message, "content": content, "traceId": metrics.trace_id_var.get()})
     except Exception as e:
-        logger.error(f"Error processing message: {str(e)}")
+        logger.error("Error processing message: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/webhook")
@@ -148,30 +342,143 @@ async def webhook(request: Request):
     Returns:
         JSONResponse: Response containing status and agent response
     """
+    arrived_at = time.time()
+    started = time.perf_counter()
+    data = None
+    response = None
     try:
+        trace_id = metrics.new_trace_id()
         data = await request.json()
-        logger.info(f"Received webhook: {data}")
-        await process_message(data)
-        return JSONResponse(
+        logger.info("Received webhook %s from %s: %s", data.get("messageId"), data.get("from"), preview(data.get("message", "")))
+        logger.debug("Webhook payload: %s", preview(data))
+
+        # Retried or duplicated deliveries are answered from the first one, never re-run
+        key = delivery_key(data)
+        previous = webhook_deduplicator.claim(key)
+        if previous is not None:
+            logger.info("Duplicate webhook delivery ignored: %s", key)
+            response = JSONResponse(
+                status_code=200,
+                content=previous
+            )
+            return response
+
+        try:
+            response = await process_message(data)
+        except Exception:
+            webhook_deduplicator.forget(key)
+            raise
+        if response.status_code != 200:
+            # Shed or failed deliveries may be retried later
+            webhook_deduplicator.forget(key)
+            return response
+        result = {"status": "success"}
+        webhook_deduplicator.complete(key, result)
+        response = JSONResponse(
             status_code=200,
-            content={"status": "success"}
+            content=result
         )
+        return response
     except Exception as e:
-        logger.error(f"Webhook error: {str(e)}")
-        return JSONResponse(
+        logger.error("Webhook error: %s", e)
+        response = JSONResponse(
             status_code=500,
             content={"status": "error", "error": str(e)}
         )
+        return response
+    finally:
+        if traffic_recorder.enabled and isinstance(data, dict):
+            status = response.status_code if response is not None else 500
+            traffic_recorder.record(data, arrived_at, status, time.perf_counter() - started)
 
 @app.get("/health")
 async def health_check():
     """
-    Health check endpoint
+    Liveness endpoint: healthy while the process serves requests and initialization has not failed
+
+    Returns:
+        JSONResponse: Health status, and whether the agent is ready to take turns
+    """
+    init_task = app.state.init_task
+    if init_task.done() and (init_task.cancelled() or init_task.exception()):
+        return JSONResponse(status_code=503, content={"status": "unhealthy", "ready": False})
+    return JSONResponse(status_code=200, content={"status": "healthy", "ready": init_task.done()})
+
+@app.get("/health/ready")
+async def readiness_check():
+    """
+    Readiness endpoint: 200 once the agent is initialized and turns can be served, 503 before
 
     Returns:
-        Dict[str, str]: Health status
+        JSONResponse: Readiness status and the time initialization took
     """
-    return {"status": "healthy"}
+    init_task = app.state.init_task
+    if not init_task.done() or init_task.cancelled() or init_task.exception():
+        return JSONResponse(status_code=503, content={"status": "starting" if not init_task.done() else "failed"})
+    from agent import mcp_toolsets
+    mcp_sessions = sum(toolset.pool.connected for toolset in mcp_toolsets(app.state.agent))
+    return JSONResponse(status_code=200, content={"status": "ready", "startup_seconds": app.state.startup_seconds, "mcp_sessions": mcp_sessions})
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Prometheus metrics endpoint
+
+    Returns:
+        Response: Turn, stage, tool and token metrics in the Prometheus text format
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+def require_admin(request: Request):
+    """
+    Reject requests without the admin bearer token
+
+    Raises:
+        HTTPException: 404 if admin endpoints are disabled, 401 if the token is wrong
+    """
+    if not PROFILING_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not hmac.compare_digest(token, PROFILING_ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+@app.post("/admin/profile")
+async def arm_profiling(request: Request):
+    """
+    Profile the next turns with a sampling profiler (admin only, rate limited)
+
+    Body: {"turns": N, "chat_id": optional chat to restrict profiling to}; turns=0 disarms.
+
+    Returns:
+        JSONResponse: Profiling status
+    """
+    require_admin(request)
+    data = await request.json()
+    try:
+        turns = int(data.get("turns", 1))
+        chat_id = data.get("chat_id")
+        if chat_id is not None and not isinstance(chat_id, str):
+            raise TypeError("chat_id must be a string")
+    except (AttributeError, TypeError, ValueError) as e:
+        return JSONResponse(status_code=400, content={"status": "error", "error": f"Invalid profiling request: {e}"})
+    try:
+        status = turn_profiler.arm(turns, chat_id)
+    except ProfilingRateLimited as e:
+        return JSONResponse(status_code=429, content={"status": "error", "error": str(e)})
+    except ImportError:
+        return JSONResponse(status_code=501, content={"status": "error", "error": "pyinstrument is not installed"})
+    return JSONResponse(status_code=200, content=status)
+
+@app.get("/admin/profile")
+async def profiling_status(request: Request):
+    """
+    Profiling status and the hot-function summaries of recently profiled turns (admin only)
+
+    Returns:
+        JSONResponse: Profiling status
+    """
+    require_admin(request)
+    return JSONResponse(status_code=200, content=turn_profiler.status())
 
 @app.get("/connect", response_class=HTMLResponse)
 async def connect_page():
@@ -207,10 +514,14 @@ if __name__ == "__main__":
     # Get port from environment variable or use default
     port = int(os.getenv("WEBHOOK_PORT", "8080"))
 
-    # Run the server
-    uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=port,
-        log_level="info"
-    )
+    # Several worker processes behind a router that keeps every chat on one worker
+    if WEBHOOK_WORKERS > 1:
+        worker_pool.run(port, WEBHOOK_WORKERS)
+    else:
+        # Run the server
+        uvicorn.run(
+            app,
+            host="0.0.0.0",
+            port=port,
+            log_level="info"
+        )
@@ -0,0 +1,292 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from admission import MAX_INFLIGHT_TURNS, MAX_QUEUED_TURNS
+
+logger = logging.getLogger(__name__)
+
+# Number of webhook worker processes; 1 serves everything from a single process
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+# Longest wait for a (re)started worker to report ready on /health/ready
+WORKER_START_TIMEOUT_SECONDS = float(os.getenv("WORKER_START_TIMEOUT_SECONDS", "120"))
+WORKER_RESTART_BACKOFF_SECONDS = 1.0
+WORKER_RESTART_MAX_BACKOFF_SECONDS = 30.0
+# Forwarded turns can take minutes (model calls, tool calls, streamed replies)
+FORWARD_TIMEOUT_SECONDS = 600
+
+
+def _score(chat_id: str, worker: int) -> int:
+    digest = hashlib.blake2b(f"{worker}:{chat_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def share(limit: int, workers: int, index: int) -> int:
+    """
+    Worker index's part of a global limit split across the workers. The parts add up
+    to the limit; WorkerPool makes sure every worker gets at least 1.
+
+    Args:
+        limit (int): The global limit
+        workers (int): Number of workers
+        index (int): Index of the worker
+
+    Returns:
+        int: The worker's limit
+    """
+    return limit // workers + (1 if index < limit % workers else 0)
+
+
+def worker_for(chat_id: str, workers: List[int]) -> int:
+    """
+    Pick the worker that owns a chat, by rendezvous hashing.
+
+    Every chat maps to the same worker for as long as that worker is up. When it is
+    down, only its chats move (to their second choice), and they move back once it
+    has restarted.
+
+    Args:
+        chat_id (str): The chat ID
+        workers (List[int]): Indexes of the workers that can take traffic
+
+    Returns:
+        int: Index of the owning worker
+    """
+    return max(workers, key=lambda worker: _score(chat_id, worker))
+
+
+class _Worker:
+    """One uvicorn process serving the webhook app on a unix socket."""
+
+    def __init__(self, index: int, socket_path: str, app_path: str):
+        self.index = index
+        self.app_path = app_path
+        self.socket_path = socket_path
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.ready = False
+        self.client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=socket_path),
+            base_url="http://worker",
+            timeout=FORWARD_TIMEOUT_SECONDS,
+        )
+
+    async def start(self, env: Dict[str, str]) -> None:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "uvicorn", self.app_path,
+            "--uds", self.socket_path, "--log-level", "warning",
+            env=env,
+        )
+        deadline = time.monotonic() + WORKER_START_TIMEOUT_SECONDS
+        while time.monotonic() < deadline and self.process.returncode is None:
+            try:
+                if (await self.client.get("/health/ready", timeout=2)).status_code == 200:
+                    self.ready = True
+                    logger.info("Worker %d ready (pid %d)", self.index, self.process.pid)
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+        logger.error("Worker %d did not become ready", self.index)
+        if self.process.returncode is None:
+            # Let the supervisor restart it
+            self.process.kill()
+
+    async def stop(self) -> None:
+        self.ready = False
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), 15)
+            except asyncio.TimeoutError:
+                self.process.kill()
+        await self.client.aclose()
+
+
+class WorkerPool:
+    """
+    Runs N webhook workers and routes every chat to the same one.
+
+    Conversation state (ADK sessions and media context, coalesced bursts, webhook
+    dedup, the streaming and admission state of a turn) stays in the memory of the
+    worker that owns the chat, so nothing has to be shared between processes.
+    Prometheus metrics of all workers are aggregated through the client's
+    multiprocess mode. MAX_INFLIGHT_TURNS and MAX_QUEUED_TURNS stay global limits:
+    each worker admits its share of them.
+
+    While a worker is down its chats are served by their second-choice worker, which
+    has none of their state: those turns start a new ADK session without the chat's
+    earlier conversation or media context.
+    """
+
+    def __init__(self, workers: int = WEBHOOK_WORKERS, app_path: str = "webhook_server:app"):
+        # Every worker needs a turn slot and a queue slot of its own; giving each one
+        # anyway would admit more turns than the global limits allow
+        if workers > min(MAX_INFLIGHT_TURNS, MAX_QUEUED_TURNS):
+            raise ValueError(f"{workers} webhook workers cannot share MAX_INFLIGHT_TURNS={MAX_INFLIGHT_TURNS} "
+                             f"and MAX_QUEUED_TURNS={MAX_QUEUED_TURNS}: use at most as many workers as either limit")
+        self.state_dir = tempfile.mkdtemp(prefix="butler-workers-")
+        self.metrics_dir = os.path.join(self.state_dir, "metrics")
+        os.makedirs(self.metrics_dir)
+        self.workers = [_Worker(i, os.path.join(self.state_dir, f"worker-{i}.sock"), app_path) for i in range(workers)]
+        self._supervisors: List[asyncio.Task] = []
+        self._stopping = False
+
+    def _worker_env(self, index: int) -> Dict[str, str]:
+        env = dict(os.environ)
+        env["PROMETHEUS_MULTIPROC_DIR"] = self.metrics_dir
+        env["WEBHOOK_WORKER_INDEX"] = str(index)
+        env["MAX_INFLIGHT_TURNS"] = str(share(MAX_INFLIGHT_TURNS, len(self.workers), index))
+        env["MAX_QUEUED_TURNS"] = str(share(MAX_QUEUED_TURNS, len(self.workers), index))
+        return env
+
+    async def start(self) -> None:
+        await asyncio.gather(*(worker.start(self._worker_env(worker.index)) for worker in self.workers))
+        self._supervisors = [asyncio.create_task(self._supervise(worker)) for worker in self.workers]
+
+    async def _supervise(self, worker: _Worker) -> None:
+        """Restart a worker that exits, with exponential backoff."""
+        backoff = WORKER_RESTART_BACKOFF_SECONDS
+        while not self._stopping:
+            started = time.monotonic()
+            returncode = await worker.process.wait()
+            worker.ready = False
+            if self._stopping:
+                return
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(worker.process.pid, self.metrics_dir)
+            # A worker that stayed up for a while restarts right away again
+            if time.monotonic() - started > 60:
+                backoff = WORKER_RESTART_BACKOFF_SECONDS
+            logger.error("Worker %d exited with code %s, restarting in %.0fs", worker.index, returncode, backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, WORKER_RESTART_MAX_BACKOFF_SECONDS)
+            await worker.start(self._worker_env(worker.index))
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for task in self._supervisors:
+            task.cancel()
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    def route(self, chat_id: str) -> Optional[_Worker]:
+        """The worker owning chat_id among those that are up, or None if none is."""
+        ready = [worker.index for worker in self.workers if worker.ready]
+        if not ready:
+            return None
+        index = worker_for(chat_id, ready)
+        owner = worker_for(chat_id, [worker.index for worker in self.workers])
+        if chat_id and index != owner:
+            logger.warning("Chat %s failed over from worker %d (down) to worker %d: the turn starts without "
+                           "the chat's session and media context", chat_id, owner, index)
+        return self.workers[index]
+
+    async def forward(self, worker: _Worker, request: Request, body: bytes) -> Response:
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in ("host", "content-length")}
+        try:
+            r = await worker.client.request(request.method, request.url.path, params=request.query_params, content=body, headers=headers)
+        except httpx.HTTPError as e:
+            logger.error("Forwarding %s to worker %d failed: %s", request.url.path, worker.index, e)
+            return JSONResponse(status_code=503, content={"status": "error", "error": "worker unavailable"})
+        return Response(content=r.content, status_code=r.status_code, media_type=r.headers.get("content-type"))
+
+    async def broadcast(self, request: Request, body: bytes) -> List[Response]:
+        ready = [worker for worker in self.workers if worker.ready]
+        return await asyncio.gather(*(self.forward(worker, request, body) for worker in ready))
+
+
+def create_router_app(pool: WorkerPool) -> FastAPI:
+    """
+    The front app of multi-worker mode, listening on WEBHOOK_PORT.
+
+    /webhook and POST /admin/profile are routed by chat, /set-connected is sent to
+    every worker, /health, /health/ready and /metrics are aggregated, anything else goes to the
+    first worker that is up.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await pool.start()
+        yield
+        await pool.stop()
+
+    app = FastAPI(title="WhatsApp Butler Webhook Router", lifespan=lifespan)
+
+    async def chat_routed(request: Request, chat_key: str) -> Response:
+        body = await request.body()
+        try:
+            chat_id = str(json.loads(body).get(chat_key) or "")
+        except (ValueError, AttributeError):
+            chat_id = ""
+        worker = pool.route(chat_id)
+        if worker is None:
+            return JSONResponse(status_code=503, content={"status": "error", "error": "no worker available"})
+        return await pool.forward(worker, request, body)
+
+    @app.post("/webhook")
+    async def webhook(request: Request):
+        return await chat_routed(request, "from")
+
+    @app.post("/admin/profile")
+    async def arm_profiling(request: Request):
+        return await chat_routed(request, "chat_id")
+
+    @app.get("/admin/profile")
+    async def profiling_status(request: Request):
+        responses = await pool.broadcast(request, b"")
+        if responses and any(r.status_code != 200 for r in responses):
+            return next(r for r in responses if r.status_code != 200)
+        return JSONResponse({"workers": [json.loads(r.body) for r in responses]})
+
+    @app.post("/set-connected")
+    async def set_connected(request: Request):
+        await pool.broadcast(request, await request.body())
+        return {"message": "Status updated"}
+
+    @app.get("/health")
+    async def health_check():
+        ready = sum(worker.ready for worker in pool.workers)
+        content: Dict[str, Any] = {"status": "healthy" if ready else "unhealthy", "workers": len(pool.workers), "ready_workers": ready}
+        return JSONResponse(status_code=200 if ready else 503, content=content)
+
+    @app.get("/health/ready")
+    async def readiness_check():
+        ready = any(worker.ready for worker in pool.workers)
+        return JSONResponse(status_code=200 if ready else 503, content={"status": "ready" if ready else "starting"})
+
+    @app.get("/metrics")
+    async def prometheus_metrics():
+        from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=pool.metrics_dir)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+    @app.api_route("/{path:path}", methods=["GET", "POST"])
+    async def passthrough(request: Request, path: str):
+        worker = pool.route("")
+        if worker is None:
+            return JSONResponse(status_code=503, content={"status": "error", "error": "no worker available"})
+        return await pool.forward(worker, request, await request.body())
+
+    return app
+
+
+def run(port: int, workers: int = WEBHOOK_WORKERS) -> None:
+    """Serve the router on port, in front of the given number of workers."""
+    import uvicorn
+
+    uvicorn.run(create_router_app(WorkerPool(workers)), host="0.0.0.0", port=port, log_level="info")